@@ -1,37 +1,476 @@
-from typing import Dict, List
-from .partitioning.sharder import Sharder
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+from .partitioning.sharder import Sharder, DEFAULT_VNODES
+from .partitioning.ring_state import load_ring_state, save_ring_state
 from .replication.replication_manager import ReplicationManager # Pastikan ini ReplicationManager
 from .storage_engine.encoding_pb2 import ValueData #type:ignore
 
-from .storage_engine.cold_storage import COLD_STORAGE_DIR
+from .storage_engine.cold_storage import COLD_STORAGE_DIR, DEFAULT_BLOOM_CAPACITY, DEFAULT_BLOOM_FALSE_POSITIVE_RATE
+from .storage_engine.hot_storage import DEFAULT_MAX_ENTRIES, DEFAULT_MAX_BYTES
+from .metrics.registry import MetricsRegistry, ProfilingHook
+from .workers.pool import RemoteShard, WorkerPool
+
+logger = logging.getLogger(__name__)
+
+# A shard hosted in this process, or a proxy to one hosted by a worker process
+Shard = ReplicationManager | RemoteShard
+
+DEFAULT_NUM_SHARDS = 4
+# Replica and WAL directories of a shard inside cold_dir
+SHARD_DIR_PATTERN = re.compile(r"^shard_(\d+)_(?:replica_\d+|wal)$")
+
+
+class _SharedExclusiveLock:
+    # Many holders of the shared side at once, or a single holder of the exclusive side.
+    # Requests take the shared side; resharding takes the exclusive side only while it
+    # swaps the ring, so it knows no request is still routing with the old one.
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._shared = 0
+        self._exclusive = False
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        with self._condition:
+            while self._exclusive:
+                self._condition.wait()
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._shared -= 1
+                if not self._shared:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        with self._condition:
+            while self._exclusive:
+                self._condition.wait()
+            self._exclusive = True # New shared holders wait from here on
+            while self._shared:
+                self._condition.wait()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._exclusive = False
+                self._condition.notify_all()
+
+
+@dataclass
+class BatchResult:
+    # values: key -> result (True for put_many, the value or None for get_many,
+    # whether the key existed for delete_many); errors: key -> exception
+    values: Dict[str, Any] = field(default_factory=dict)
+    errors: Dict[str, Exception] = field(default_factory=dict)
+
 
 class KeyValueStore:
-    def __init__(self, num_shards: int = 4): # Example: 4 shards
-        self.num_shards = num_shards
-        self.sharder = Sharder(num_shards)
+    def __init__(self, num_shards: int | None = None, # Defaults to the layout saved in cold_dir, else 4
+                 hot_max_entries: int | None = DEFAULT_MAX_ENTRIES, # Per shard
+                 hot_max_bytes: int | None = DEFAULT_MAX_BYTES, # Per shard, approximate
+                 eviction_policy: str = "lru", # "lru" or "arc"
+                 shard_weights: Dict[int, float] | None = None, # Explicit ring layout, overrides num_shards
+                 vnodes: int = DEFAULT_VNODES,
+                 batch_workers: int | None = None, # Threads running shard batches, defaults to the shard count
+                 write_quorum: int | str = "all", # Cold replicas that must ack a write: 1, 2 or "all"
+                 read_quorum: int | str = 1, # Cold replicas consulted on a hot miss
+                 write_back: bool = False, # Ack puts from hot storage + WAL, flush to cold in the background
+                 wal_commit_window: float = 0.001, # Seconds a WAL group commit waits for more writers
+                 flush_interval: float = 1.0, # Seconds between write-back flushes
+                 bloom_capacity: int = DEFAULT_BLOOM_CAPACITY, # Per cold replica, the filter grows past it
+                 bloom_false_positive_rate: float = DEFAULT_BLOOM_FALSE_POSITIVE_RATE,
+                 metrics_enabled: bool = True, # Tier counters and latency histograms, see metrics_snapshot()
+                 profiling_hook: ProfilingHook | None = None, # Called with (operation, shard_id, seconds)
+                 cold_dir: str | None = None, # Parent of every shard's replica and WAL directories, COLD_STORAGE_DIR by default
+                 workers: int = 0, # Worker processes hosting the shards, 0 keeps them in this process
+                 worker_start_method: str = "spawn", # multiprocessing start method of the workers
+                 worker_threads: int = 4, # Threads per worker serving pipelined requests
+                 health_interval: float = 1.0, # Seconds between worker health checks
+                 health_timeout: float = 5.0, # Seconds a worker may go without answering before it is restarted
+                 worker_request_timeout: float | None = 30.0): # Seconds before a worker request fails
+        self.hot_max_entries = hot_max_entries
+        self.hot_max_bytes = hot_max_bytes
+        self.eviction_policy = eviction_policy
+        self.write_quorum = write_quorum
+        self.read_quorum = read_quorum
+        self.write_back = write_back
+        self.wal_commit_window = wal_commit_window
+        self.flush_interval = flush_interval
+        self.bloom_capacity = bloom_capacity
+        self.bloom_false_positive_rate = bloom_false_positive_rate
+        self.cold_dir = cold_dir or COLD_STORAGE_DIR
+        self.metrics = MetricsRegistry(enabled=metrics_enabled, profiling_hook=profiling_hook)
+        # The layout saved in cold_dir wins; a different explicit layout is refused rather
+        # than silently routing keys away from the shards that hold them
+        configured = None
+        if shard_weights:
+            configured = Sharder.from_weights(shard_weights, vnodes=vnodes)
+        elif num_shards is not None:
+            configured = Sharder(num_shards, vnodes=vnodes)
+        ring_state = load_ring_state(self.cold_dir)
+        if ring_state is None:
+            self.sharder = configured or Sharder(DEFAULT_NUM_SHARDS, vnodes=vnodes)
+        else:
+            self.sharder = ring_state["sharder"]
+            if configured is not None and (configured.weights != self.sharder.weights or configured.vnodes != self.sharder.vnodes):
+                raise ValueError(
+                    f"{self.cold_dir} holds a ring with shard weights {self.sharder.weights} and {self.sharder.vnodes} vnodes, "
+                    f"not {configured.weights} and {configured.vnodes} vnodes; open it without num_shards/shard_weights "
+                    f"and change the layout with add_shard/remove_shard"
+                )
+        self.num_shards = self.sharder.num_shards
 
-        self.shards: Dict[int, ReplicationManager] = {
-            i: ReplicationManager(shard_id=i, total_shards=num_shards, base_cold_dir=COLD_STORAGE_DIR)
-            for i in range(num_shards)
+        # With workers, each shard lives in one of the worker processes and self.shards holds
+        # RemoteShard proxies. The profiling hook only sees store-level operations then.
+        self._worker_pool: WorkerPool | None = None
+        if workers:
+            self._worker_pool = WorkerPool(workers, start_method=worker_start_method,
+                                           threads_per_worker=worker_threads, health_interval=health_interval,
+                                           health_timeout=health_timeout, request_timeout=worker_request_timeout)
+
+        # While resharding, _previous_sharder is the ring keys are moving away from
+        self._previous_sharder: Sharder | None = None
+        self._routing_lock = _SharedExclusiveLock()
+        self._migration_lock = threading.Lock()
+        self._resharding_lock = threading.Lock()
+        self._batch_executor = ThreadPoolExecutor(
+            max_workers=batch_workers or self.num_shards, thread_name_prefix="kv-batch"
+        )
+
+        self.shards: Dict[int, Shard] = {
+            i: self._new_shard(i) for i in self.sharder.shard_ids
         }
+        # Without a saved layout the data on disk may have been written with another routing
+        # (older versions placed keys by hash modulo the shard count), and an interrupted
+        # resharding leaves keys on their old shards: move them before serving requests
+        if ring_state is None or ring_state["resharding"]:
+            self._rehome()
+        save_ring_state(self.cold_dir, self.sharder)
+
+    def _new_shard(self, shard_id: int) -> Shard:
+        if self._worker_pool is not None:
+            return self._worker_pool.open_shard(shard_id, {
+                "total_shards": self.num_shards, "base_cold_dir": self.cold_dir,
+                "hot_max_entries": self.hot_max_entries, "hot_max_bytes": self.hot_max_bytes,
+                "eviction_policy": self.eviction_policy,
+                "write_quorum": self.write_quorum, "read_quorum": self.read_quorum,
+                "write_back": self.write_back, "wal_commit_window": self.wal_commit_window,
+                "flush_interval": self.flush_interval, "metrics_enabled": self.metrics.enabled,
+                "bloom_capacity": self.bloom_capacity, "bloom_false_positive_rate": self.bloom_false_positive_rate,
+            })
+        return ReplicationManager(shard_id=shard_id, total_shards=self.num_shards, base_cold_dir=self.cold_dir,
+                                  hot_max_entries=self.hot_max_entries, hot_max_bytes=self.hot_max_bytes,
+                                  eviction_policy=self.eviction_policy,
+                                  write_quorum=self.write_quorum, read_quorum=self.read_quorum,
+                                  write_back=self.write_back, wal_commit_window=self.wal_commit_window,
+                                  flush_interval=self.flush_interval, bloom_capacity=self.bloom_capacity,
+                                  bloom_false_positive_rate=self.bloom_false_positive_rate,
+                                  metrics=self.metrics.shard(shard_id))
 
     def put(self, key: str, value: str):
-        shard_id = self.sharder.get_shard_id(key)
+        started = time.perf_counter()
         value_data_pb2 = ValueData(data=value) # Create protobuf message
-        self.shards[shard_id].put_data(key, value_data_pb2)
-        print(f"PUT: Key '{key}' mapped to shard {shard_id}")
+        with self._routing_lock.shared():
+            self._route_put(key, value_data_pb2)
+        self.metrics.observe("put", time.perf_counter() - started)
 
     def get(self, key: str) -> str | None:
+        started = time.perf_counter()
+        with self._routing_lock.shared():
+            _, value_data_pb2 = self._route_get(key)
+        self.metrics.observe("get", time.perf_counter() - started)
+        return value_data_pb2.data if value_data_pb2 else None
+
+    def delete(self, key: str) -> bool:
+        started = time.perf_counter()
+        with self._routing_lock.shared():
+            deleted = self._route_delete(key)
+        self.metrics.observe("delete", time.perf_counter() - started)
+        return deleted
+
+    # The _route_* helpers expect the caller to hold the shared routing lock
+
+    def _route_put(self, key: str, value_data_pb2: ValueData) -> int:
+        shard_id = self.sharder.get_shard_id(key)
+        if self._previous_sharder is None:
+            self.shards[shard_id].put_data(key, value_data_pb2)
+        else:
+            # Serialize with the key moves so a migration never overwrites this write
+            with self._migration_lock:
+                self.shards[shard_id].put_data(key, value_data_pb2)
+        return shard_id
+
+    def _route_get(self, key: str) -> Tuple[int, ValueData | None]:
         shard_id = self.sharder.get_shard_id(key)
         value_data_pb2 = self.shards[shard_id].get_data(key)
-        if value_data_pb2:
-            print(f"GET: Key '{key}' found on shard {shard_id}")
-            return value_data_pb2.data
-        print(f"GET: Key '{key}' not found on shard {shard_id}")
-        return None
+        previous_sharder = self._previous_sharder
+        if not value_data_pb2 and previous_sharder is not None:
+            # Not moved yet: read the old owner, then the new one again in case the
+            # key was moved between the two lookups
+            old_shard_id = previous_sharder.get_shard_id(key)
+            if old_shard_id != shard_id:
+                value_data_pb2 = self.shards[old_shard_id].get_data(key) or self.shards[shard_id].get_data(key)
+        return shard_id, value_data_pb2
+
+    def _route_delete(self, key: str) -> bool:
+        shard_id = self.sharder.get_shard_id(key)
+        if self._previous_sharder is None:
+            return self.shards[shard_id].delete_data(key)
+        with self._migration_lock:
+            deleted = self.shards[shard_id].delete_data(key)
+            old_shard_id = self._previous_sharder.get_shard_id(key)
+            if old_shard_id != shard_id:
+                deleted = self.shards[old_shard_id].delete_data(key) or deleted
+            return deleted
+
+    # --- Batched operations ---
+    # Keys are grouped by shard and each group goes down as one batch; groups run
+    # concurrently on the batch executor. A failing shard batch marks all of its
+    # keys as failed in BatchResult.errors, the other shards are unaffected.
+
+    def put_many(self, items: Dict[str, str]) -> BatchResult:
+        started = time.perf_counter()
+        values = {key: ValueData(data=value) for key, value in items.items()}
+
+        def put_key(key: str) -> bool:
+            self._route_put(key, values[key])
+            return True
+
+        def put_batch(shard: Shard, keys: List[str]) -> Dict[str, bool]:
+            shard.put_many({key: values[key] for key in keys})
+            return dict.fromkeys(keys, True)
+
+        with self._routing_lock.shared():
+            if self._previous_sharder is not None:
+                result = self._run_per_key(list(values), put_key)
+            else:
+                result = self._run_batches(list(values), put_batch)
+        self.metrics.observe("put_many", time.perf_counter() - started)
+        return result
+
+    def get_many(self, keys: List[str]) -> BatchResult:
+        started = time.perf_counter()
+        with self._routing_lock.shared():
+            if self._previous_sharder is not None:
+                result = self._run_per_key(keys, lambda key: self._route_get(key)[1])
+            else:
+                result = self._run_batches(keys, lambda shard, shard_keys: shard.get_many(shard_keys))
+        result.values = {key: data.data if data else None for key, data in result.values.items()}
+        self.metrics.observe("get_many", time.perf_counter() - started)
+        return result
+
+    def delete_many(self, keys: List[str]) -> BatchResult:
+        started = time.perf_counter()
+        with self._routing_lock.shared():
+            if self._previous_sharder is not None:
+                result = self._run_per_key(keys, self._route_delete)
+            else:
+                result = self._run_batches(keys, lambda shard, shard_keys: shard.delete_many(shard_keys))
+        self.metrics.observe("delete_many", time.perf_counter() - started)
+        return result
+
+    def _run_batches(self, keys: List[str], batch_op: Callable[[Shard, List[str]], Dict[str, Any]]) -> BatchResult:
+        groups: Dict[int, List[str]] = {}
+        for key in dict.fromkeys(keys): # Drop duplicates, keep order
+            groups.setdefault(self.sharder.get_shard_id(key), []).append(key)
+
+        result = BatchResult()
+        futures = {}
+        if len(groups) > 1: # A single group runs inline, there is nothing to overlap
+            futures = {shard_id: self._batch_executor.submit(batch_op, self.shards[shard_id], shard_keys)
+                       for shard_id, shard_keys in groups.items()}
+        for shard_id, shard_keys in groups.items():
+            try:
+                if shard_id in futures:
+                    result.values.update(futures[shard_id].result())
+                else:
+                    result.values.update(batch_op(self.shards[shard_id], shard_keys))
+            except Exception as e:
+                result.errors.update(dict.fromkeys(shard_keys, e))
+        return result
+
+    @staticmethod
+    def _run_per_key(keys: List[str], key_op: Callable[[str], Any]) -> BatchResult:
+        # Slow path used while resharding, where a key can live on either of two shards
+        result = BatchResult()
+        for key in dict.fromkeys(keys):
+            try:
+                result.values[key] = key_op(key)
+            except Exception as e:
+                result.errors[key] = e
+        return result
+
+    # --- Online resharding ---
+
+    def add_shard(self, weight: float = 1.0) -> int:
+        # Adds a shard to the ring and moves over only the keys that now belong to it
+        with self._resharding_lock:
+            self._finish_resharding()
+            shard_id = max(self.shards) + 1
+            new_sharder = self.sharder.with_shard(shard_id, weight)
+            self.shards[shard_id] = self._new_shard(shard_id)
+            self._reshard(new_sharder)
+            logger.info("Shard %s added with weight %s.", shard_id, weight)
+            return shard_id
+
+    def remove_shard(self, shard_id: int):
+        # Moves every key of the shard to its new owner, then drops the shard
+        with self._resharding_lock:
+            self._finish_resharding()
+            if shard_id not in self.shards:
+                return # Its unfinished removal just completed
+            new_sharder = self.sharder.without_shard(shard_id)
+            self._reshard(new_sharder)
+            self._drop_shard(shard_id)
+            logger.info("Shard %s removed.", shard_id)
+
+    def resume_resharding(self):
+        # Finishes moving keys after an add_shard/remove_shard that failed part way. Until
+        # then requests take the slow per-key path, and resharding again resumes it first.
+        with self._resharding_lock:
+            self._finish_resharding()
+
+    def _finish_resharding(self):
+        # Caller holds _resharding_lock. Raises if the unfinished migration fails again,
+        # so a new ring is never started on top of it.
+        if self._previous_sharder is None:
+            return
+        logger.info("Resuming the unfinished migration to shards %s.", self.sharder.shard_ids)
+        self._migrate()
+        # Shards whose removal was interrupted are empty now
+        for shard_id in set(self.shards) - set(self.sharder.shard_ids):
+            self._drop_shard(shard_id)
+            logger.info("Shard %s removed.", shard_id)
+
+    def _drop_shard(self, shard_id: int):
+        self.shards.pop(shard_id).close()
+        self._remove_shard_dirs(shard_id) # Every key was moved off it
+
+    def _reshard(self, new_sharder: Sharder):
+        save_ring_state(self.cold_dir, new_sharder, resharding=True)
+        with self._routing_lock.exclusive():
+            self._previous_sharder = self.sharder
+            self.sharder = new_sharder
+            self.num_shards = new_sharder.num_shards
+        try:
+            self._migrate()
+        except Exception as e:
+            # Both rings stay in use, so every key is still found; the saved ring state
+            # makes a restart rehome whatever did not move
+            logger.error("Moving keys to shards %s failed, resharding is unfinished: %s", new_sharder.shard_ids, e)
+            raise
+
+    def _migrate(self):
+        # Requests keep being served while keys move: writes go to the new owner,
+        # reads fall back to the old owner until the key has been moved
+        old_sharder, new_sharder = self._previous_sharder, self.sharder
+        for source_id in old_sharder.shard_ids:
+            source = self.shards[source_id]
+            for key in source.get_all_keys():
+                target_id = new_sharder.get_shard_id(key)
+                if target_id != source_id:
+                    self._move_key(key, source, self.shards[target_id])
+
+        with self._routing_lock.exclusive():
+            self._previous_sharder = None
+        save_ring_state(self.cold_dir, new_sharder)
+
+    def _shard_ids_on_disk(self) -> set:
+        if not os.path.isdir(self.cold_dir):
+            return set()
+        return {int(match.group(1)) for match in map(SHARD_DIR_PATTERN.match, os.listdir(self.cold_dir)) if match}
+
+    def _remove_shard_dirs(self, shard_id: int):
+        for name in os.listdir(self.cold_dir):
+            match = SHARD_DIR_PATTERN.match(name)
+            if match and int(match.group(1)) == shard_id:
+                shutil.rmtree(os.path.join(self.cold_dir, name))
+
+    def _rehome(self):
+        # Moves every key that is not on the shard the ring assigns it to. Directories of
+        # shards that are not on the ring are opened, drained and removed.
+        stray_ids = sorted(self._shard_ids_on_disk() - set(self.shards))
+        sources = {shard_id: self.shards[shard_id] for shard_id in self.shards}
+        sources.update({shard_id: self._new_shard(shard_id) for shard_id in stray_ids})
+        moved = 0
+        for source_id, source in sources.items():
+            for key in source.get_all_keys():
+                target_id = self.sharder.get_shard_id(key)
+                if target_id != source_id:
+                    self._move_key(key, source, self.shards[target_id])
+                    moved += 1
+        for shard_id in stray_ids:
+            sources[shard_id].flush_hot_to_cold()
+            sources[shard_id].close()
+            self._remove_shard_dirs(shard_id)
+        if moved:
+            logger.info("Moved %d keys to the shards the ring assigns them to.", moved)
+
+    def _move_key(self, key: str, source: Shard, target: Shard):
+        with self._migration_lock:
+            value_data_pb2 = source.get_data(key)
+            # A write that reached the new owner during the migration is newer, keep it
+            if value_data_pb2 and not target.get_data(key):
+                target.put_data(key, value_data_pb2)
+            source.delete_data(key)
+
+    def hot_stats(self) -> Dict[int, Dict[str, int]]:
+        return {shard_id: rm.hot_stats() for shard_id, rm in self.shards.items()}
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        # Store-level latency per operation, tier counters summed over shards, and per-shard
+        # counters and latencies (cold_read, replicate, wal_append, flush); seconds throughout
+        remote_shards = {
+            shard_id: shard.metrics_snapshot() for shard_id, shard in self.shards.items() if isinstance(shard, RemoteShard)
+        }
+        return self.metrics.snapshot(remote_shards)
+
+    def reset_metrics(self):
+        self.metrics.reset()
+        for shard in self.shards.values():
+            if isinstance(shard, RemoteShard):
+                shard.reset_metrics()
+
+    def worker_stats(self) -> Dict[str, Any]:
+        # Worker processes, their pids and shards, and how often a worker was restarted
+        if self._worker_pool is None:
+            return {"workers": [], "restarts": 0}
+        return {"workers": self._worker_pool.worker_stats(), "restarts": self._worker_pool.restarts}
+
+    def bloom_stats(self) -> Dict[int, List[Dict[str, int]]]:
+        # Per shard, one entry per cold replica
+        return {shard_id: rm.bloom_stats() for shard_id, rm in self.shards.items()}
 
     def shutdown(self):
-        # Optionally, flush all hot data to cold storage on shutdown
+        # Flush whatever is not in cold storage yet (in write-back mode the background
+        # flushers have been doing this all along) and close the shards. A shard that fails
+        # to shut down does not keep the others from closing; the first error is raised after.
+        errors = []
         for shard_id in self.shards:
-            self.shards[shard_id].flush_hot_to_cold()
-        print("Key-Value Store shut down. All hot data flushed.")
\ No newline at end of file
+            try:
+                self.shards[shard_id].flush_hot_to_cold()
+            except Exception as e:
+                logger.error("Shard %s: flush on shutdown failed: %s", shard_id, e)
+                errors.append(e)
+            try:
+                self.shards[shard_id].close()
+            except Exception as e:
+                logger.error("Shard %s: close failed: %s", shard_id, e)
+                errors.append(e)
+        self._batch_executor.shutdown()
+        if self._worker_pool is not None:
+            self._worker_pool.close()
+        if errors:
+            raise errors[0]
+        logger.info("Key-Value Store shut down. All hot data flushed.")
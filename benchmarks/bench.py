@@ -0,0 +1,168 @@
+import argparse
+import cProfile
+import json
+import logging
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+from ..api import KeyValueStore
+from ..metrics.registry import log_slow_operations
+from .workloads import WORKLOADS, Operation, key_name, load_trace, synthetic_operations
+
+# Replays a trace or a synthetic YCSB-style mix against a KeyValueStore and reports
+# throughput plus the latency percentiles and tier hit rates from the store's metrics.
+#
+#   python -m package.benchmarks.bench --workload ycsb-b --operations 200000 --threads 4
+#   python -m package.benchmarks.bench --trace ops.jsonl --batch-size 64
+
+
+def preload(store: KeyValueStore, num_keys: int, value_size: int, chunk: int = 1000):
+    value = "x" * value_size
+    for start in range(0, num_keys, chunk):
+        store.put_many({key_name(i): value for i in range(start, min(start + chunk, num_keys))})
+
+
+def _run_slice(store: KeyValueStore, operations: List[Operation], batch_size: int, errors: List[int]):
+    failed = 0
+    if batch_size <= 1:
+        for operation, key, value in operations:
+            try:
+                if operation == "get":
+                    store.get(key)
+                elif operation == "put":
+                    store.put(key, value or "")
+                else:
+                    store.delete(key)
+            except Exception:
+                failed += 1
+    else:
+        # Runs of the same operation go down as one batch call
+        start = 0
+        while start < len(operations):
+            operation = operations[start][0]
+            end = start
+            while end < len(operations) and end - start < batch_size and operations[end][0] == operation:
+                end += 1
+            batch = operations[start:end]
+            try:
+                if operation == "get":
+                    result = store.get_many([key for _, key, _ in batch])
+                elif operation == "put":
+                    result = store.put_many({key: value or "" for _, key, value in batch})
+                else:
+                    result = store.delete_many([key for _, key, _ in batch])
+                failed += len(result.errors)
+            except Exception:
+                failed += len(batch)
+            start = end
+    errors.append(failed)
+
+
+def run(store: KeyValueStore, operations: List[Operation], threads: int = 1, batch_size: int = 1) -> Dict[str, Any]:
+    # Operations are dealt round-robin to the threads, so each thread keeps the trace order
+    # of its own share. Metrics recorded before the run (e.g. by preload) are discarded.
+    store.reset_metrics()
+    slices = [operations[i::threads] for i in range(threads)]
+    errors: List[int] = []
+    clients = [threading.Thread(target=_run_slice, args=(store, ops, batch_size, errors)) for ops in slices]
+    started = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - started
+
+    snapshot = store.metrics_snapshot()
+    tiers = snapshot["tiers"]
+    reads = tiers["hot_hits"] + tiers["cold_hits"] + tiers["misses"]
+    return {
+        "operations": len(operations),
+        "errors": sum(errors),
+        "seconds": elapsed,
+        "throughput": len(operations) / elapsed if elapsed else 0.0,
+        "hot_hit_rate": tiers["hot_hits"] / reads if reads else 0.0,
+        "latency": snapshot["operations"],
+        "tiers": tiers,
+        "shard_latency": {shard_id: shard["latency"] for shard_id, shard in snapshot["shards"].items()},
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [
+        f"operations: {report['operations']}  errors: {report['errors']}  seconds: {report['seconds']:.2f}",
+        f"throughput: {report['throughput']:,.0f} ops/s  hot hit rate: {report['hot_hit_rate']:.1%}",
+        "",
+        f"{'operation':<12}{'count':>10}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}",
+    ]
+    for operation, summary in sorted(report["latency"].items()):
+        lines.append(
+            f"{operation:<12}{summary['count']:>10}{summary['mean'] * 1000:>10.3f}"
+            f"{summary['p50'] * 1000:>10.3f}{summary['p99'] * 1000:>10.3f}{summary['max'] * 1000:>10.3f}"
+        )
+    lines.append("")
+    lines.append("tiers: " + ", ".join(f"{counter}={value}" for counter, value in report["tiers"].items()))
+    return "\n".join(lines)
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(description="Benchmark a KeyValueStore with a trace or a synthetic workload")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--trace", help="JSONL file to replay, one operation per line")
+    source.add_argument("--workload", choices=sorted(WORKLOADS), default="ycsb-a")
+    parser.add_argument("--operations", type=int, default=100_000, help="Synthetic workload length")
+    parser.add_argument("--keys", type=int, default=10_000, help="Synthetic key space, preloaded before the run")
+    parser.add_argument("--value-size", type=int, default=100)
+    parser.add_argument("--theta", type=float, default=0.99, help="Zipfian skew, between 0 and 1 (exclusive)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=1, help="Group runs of one operation into *_many calls")
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--eviction-policy", choices=["lru", "arc"], default="lru")
+    parser.add_argument("--hot-max-entries", type=int, default=None, help="Per shard, defaults to the store's")
+    parser.add_argument("--write-back", action="store_true")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes hosting the shards")
+    parser.add_argument("--data-dir", help="Cold storage directory, a temporary one by default")
+    parser.add_argument("--slow-ms", type=float, help="Log operations slower than this")
+    parser.add_argument("--profile", metavar="FILE", help="Run under cProfile and write the stats to FILE")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+    if not 0 < args.theta < 1:
+        parser.error(f"--theta must be between 0 and 1 (exclusive), got {args.theta}")
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="kv-bench-")
+    store_options: Dict[str, Any] = {}
+    if args.hot_max_entries is not None:
+        store_options["hot_max_entries"] = args.hot_max_entries
+    store = KeyValueStore(
+        num_shards=args.shards, eviction_policy=args.eviction_policy, write_back=args.write_back, cold_dir=data_dir,
+        workers=args.workers,
+        profiling_hook=log_slow_operations(args.slow_ms / 1000) if args.slow_ms is not None else None,
+        **store_options,
+    )
+    try:
+        if args.trace:
+            operations = list(load_trace(args.trace))
+        else:
+            preload(store, args.keys, args.value_size)
+            operations = synthetic_operations(args.workload, args.operations, args.keys, args.value_size,
+                                              args.theta, args.seed)
+        if args.profile:
+            profiler = cProfile.Profile()
+            report = profiler.runcall(run, store, operations, args.threads, args.batch_size)
+            profiler.dump_stats(args.profile)
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+        else:
+            report = run(store, operations, args.threads, args.batch_size)
+        print(json.dumps(report, indent=2) if args.json else format_report(report))
+    finally:
+        store.shutdown()
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import json
+import random
+from typing import Dict, Iterator, List, Tuple
+
+# One workload step: (operation, key, value); value is None except for puts
+Operation = Tuple[str, str, str | None]
+
+# YCSB core workloads A-C plus a write-only mix; operation -> share of the mix
+WORKLOADS: Dict[str, Dict[str, float]] = {
+    "ycsb-a": {"get": 0.5, "put": 0.5}, # Update heavy
+    "ycsb-b": {"get": 0.95, "put": 0.05}, # Read mostly
+    "ycsb-c": {"get": 1.0}, # Read only
+    "write-only": {"put": 1.0},
+}
+
+
+class ZipfianGenerator:
+    # Draws integers in [0, num_items) where item i has weight 1 / (i + 1) ** theta, using
+    # the constant-time method of Gray et al. that YCSB uses. theta=0.99 is YCSB's default;
+    # the method only covers 0 < theta < 1 (alpha = 1 / (1 - theta)).
+    def __init__(self, num_items: int, theta: float = 0.99, rng: random.Random | None = None):
+        if not 0 < theta < 1:
+            raise ValueError(f"theta must be between 0 and 1 (exclusive), got {theta}")
+        if num_items < 1:
+            raise ValueError(f"num_items must be at least 1, got {num_items}")
+        self.num_items = num_items
+        self.theta = theta
+        self.rng = rng or random.Random()
+        self.zeta_n = sum(1 / (i ** theta) for i in range(1, num_items + 1))
+        zeta_2 = 1 + 1 / (2 ** theta)
+        self.alpha = 1 / (1 - theta)
+        self.eta = (1 - (2 / num_items) ** (1 - theta)) / (1 - zeta_2 / self.zeta_n)
+
+    def next(self) -> int:
+        u = self.rng.random()
+        uz = u * self.zeta_n
+        if uz < 1:
+            return 0
+        if uz < 1 + 0.5 ** self.theta:
+            return 1
+        return min(int(self.num_items * (self.eta * u - self.eta + 1) ** self.alpha), self.num_items - 1)
+
+
+def key_name(index: int) -> str:
+    return f"user{index:010d}"
+
+
+def synthetic_operations(workload: str, num_operations: int, num_keys: int, value_size: int = 100,
+                         theta: float = 0.99, seed: int = 0) -> List[Operation]:
+    # Keys are drawn from a Zipfian distribution scattered over the key space (YCSB's
+    # "scrambled zipfian"), so the hot keys don't all land next to each other on the ring
+    if workload not in WORKLOADS:
+        raise ValueError(f"Unknown workload {workload!r}, expected one of {sorted(WORKLOADS)}")
+    rng = random.Random(seed)
+    zipf = ZipfianGenerator(num_keys, theta, rng)
+    scramble = list(range(num_keys))
+    rng.shuffle(scramble)
+    names, weights = zip(*WORKLOADS[workload].items())
+    value = "x" * value_size
+    return [
+        (operation, key_name(scramble[zipf.next()]), value if operation == "put" else None)
+        for operation in rng.choices(names, weights, k=num_operations)
+    ]
+
+
+def load_trace(path: str) -> Iterator[Operation]:
+    # JSONL trace, one operation per line: {"op": "get" | "put" | "delete", "key": ..., "value": ...}.
+    # Lines without an "op" (any other JSONL log) are replayed as a put of the whole line,
+    # keyed by its "request_id" or "id" field, or by its line number.
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, dict) and "op" in record:
+                operation = record["op"].lower()
+                if operation not in ("get", "put", "delete"):
+                    raise ValueError(f"{path}:{line_number}: unknown op {record['op']!r}")
+                value = record.get("value")
+                yield operation, str(record["key"]), None if value is None else str(value)
+            else:
+                key = record.get("request_id", record.get("id")) if isinstance(record, dict) else None
+                yield "put", str(key if key is not None else line_number), line
@@ -37,5 +37,8 @@ if __name__ == "__main__":
     store.shards[shard_id_for_hobby].move_to_cold("hobby")
     print(f"Get 'hobby' after potential move: {store.get('hobby')}") # Should still be retrievable from cold
 
+    print("\n--- Tier counters ---")
+    print(store.metrics_snapshot()["tiers"])
+
     print("\n--- Shutting down store (flushing hot data) ---")
     store.shutdown()
\ No newline at end of file
@@ -0,0 +1,121 @@
+import logging
+import threading
+from typing import Any, Callable, Dict
+from .histogram import LatencyHistogram
+
+# Called after every timed operation with (operation, shard id or None for
+# store-level operations, seconds), e.g. to feed a tracer or log slow calls
+ProfilingHook = Callable[[str, int | None, float], None]
+
+# Per-shard tier counters, always present in a snapshot even when still zero
+TIER_COUNTERS = (
+    "hot_hits", # Served from hot storage
+    "cold_hits", # Hot miss served from the cold replicas
+    "misses", # Not found in any tier
+    "replica_fallbacks", # Served by a replica other than the primary (primary missing, stale or failed)
+    "replica_read_errors",
+    "promotions", # Cold reads copied into hot storage
+    "demotions", # Dirty hot entries written to cold storage on eviction
+    "hinted_replays", # Hinted writes applied to a replica that had missed them
+    "flushed_keys", # Dirty entries written to cold storage by write-back flushes
+)
+
+
+class ShardMetrics:
+    # Tier counters and per-operation latency histograms of one shard
+    def __init__(self, shard_id: int, registry: "MetricsRegistry"):
+        self.shard_id = shard_id
+        self._registry = registry
+        self._counters: Dict[str, int] = dict.fromkeys(TIER_COUNTERS, 0)
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, counter: str, amount: int = 1):
+        if not self._registry.enabled or not amount:
+            return
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def observe(self, operation: str, seconds: float):
+        self._registry._observe(self._histograms, operation, seconds, self.shard_id)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            "counters": counters,
+            "latency": {operation: histogram.summary() for operation, histogram in list(self._histograms.items())},
+        }
+
+    def reset(self):
+        with self._lock:
+            self._counters = dict.fromkeys(TIER_COUNTERS, 0)
+        self._histograms.clear()
+
+
+class MetricsRegistry:
+    # Store-wide metrics: latency histograms of the KeyValueStore operations plus a
+    # ShardMetrics per shard. With enabled=False every update is a no-op.
+    def __init__(self, enabled: bool = True, profiling_hook: ProfilingHook | None = None):
+        self.enabled = enabled
+        self.profiling_hook = profiling_hook
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._shards: Dict[int, ShardMetrics] = {}
+        self._lock = threading.Lock()
+
+    def shard(self, shard_id: int) -> ShardMetrics:
+        with self._lock:
+            if shard_id not in self._shards:
+                self._shards[shard_id] = ShardMetrics(shard_id, self)
+            return self._shards[shard_id]
+
+    def observe(self, operation: str, seconds: float):
+        self._observe(self._histograms, operation, seconds, None)
+
+    def _observe(self, histograms: Dict[str, LatencyHistogram], operation: str, seconds: float, shard_id: int | None):
+        if not self.enabled:
+            return
+        histogram = histograms.get(operation)
+        if histogram is None:
+            with self._lock:
+                histogram = histograms.setdefault(operation, LatencyHistogram())
+        histogram.record(seconds)
+        if self.profiling_hook is not None:
+            self.profiling_hook(operation, shard_id, seconds)
+
+    def snapshot(self, remote_shards: Dict[int, Dict[str, Any]] | None = None) -> Dict[str, Any]:
+        # Latencies in seconds. "tiers" sums the shard counters. remote_shards holds the
+        # snapshots of shards whose ShardMetrics live in another process.
+        with self._lock:
+            shards = dict(self._shards)
+        shard_snapshots = {shard_id: shard.snapshot() for shard_id, shard in shards.items()}
+        shard_snapshots.update(remote_shards or {})
+        shard_snapshots = dict(sorted(shard_snapshots.items()))
+        tiers: Dict[str, int] = dict.fromkeys(TIER_COUNTERS, 0)
+        for snapshot in shard_snapshots.values():
+            for counter, value in snapshot["counters"].items():
+                tiers[counter] = tiers.get(counter, 0) + value
+        return {
+            "operations": {operation: histogram.summary() for operation, histogram in list(self._histograms.items())},
+            "tiers": tiers,
+            "shards": shard_snapshots,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            shards = list(self._shards.values())
+        for shard in shards:
+            shard.reset()
+
+
+def log_slow_operations(threshold: float, logger: logging.Logger | None = None) -> ProfilingHook:
+    # Profiling hook that logs every operation slower than threshold seconds
+    logger = logger or logging.getLogger(f"{__name__}.slow")
+
+    def hook(operation: str, shard_id: int | None, seconds: float):
+        if seconds >= threshold:
+            scope = "store" if shard_id is None else f"shard {shard_id}"
+            logger.warning("Slow %s on %s: %.3f ms", operation, scope, seconds * 1000)
+
+    return hook
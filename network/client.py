@@ -0,0 +1,167 @@
+import asyncio
+import itertools
+from typing import Dict, List, Tuple
+from .protocol import (
+    DEFAULT_PORT, FRAME_HEADER, OP_GET, OP_PUT, OP_DELETE, OP_MGET, OP_MSET, OP_MDELETE, OP_PING,
+    STATUS_OK, ENTRY_OK, ENTRY_ERROR,
+    encode_frame, encode_entries, decode_entries,
+)
+
+
+class KeyValueClientError(Exception):
+    # Raised when the server rejects a request, or when some keys of a multi-key
+    # request failed; errors maps those keys to the server's message and values
+    # holds the results of the keys that succeeded.
+    def __init__(self, message: str, errors: Dict[str, str] | None = None, values: Dict[str, object] | None = None):
+        super().__init__(message)
+        self.errors = errors or {}
+        self.values = values or {}
+
+
+class _Connection:
+    # One pipelined connection: requests are written as they come and a reader task
+    # resolves the matching future when its response arrives
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, max_in_flight: int):
+        self._reader = reader
+        self._writer = writer
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._request_ids = itertools.count(1)
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._write_lock = asyncio.Lock()
+        self._reader_task = asyncio.create_task(self._read_responses())
+
+    @property
+    def closed(self) -> bool:
+        return self._reader_task.done()
+
+    @property
+    def load(self) -> int:
+        return len(self._pending)
+
+    async def request(self, opcode: int, payload: bytes = b"") -> bytes:
+        async with self._in_flight:
+            if self.closed:
+                raise ConnectionError("Connection to the key-value server is closed")
+            request_id = next(self._request_ids) & 0xFFFFFFFF
+            future = asyncio.get_running_loop().create_future()
+            self._pending[request_id] = future
+            try:
+                async with self._write_lock:
+                    self._writer.write(encode_frame(opcode, request_id, payload))
+                    await self._writer.drain()
+                status, response = await future
+            finally:
+                self._pending.pop(request_id, None)
+        if status != STATUS_OK:
+            raise KeyValueClientError(response.decode("utf-8", errors="replace"))
+        return response
+
+    async def _read_responses(self):
+        error: Exception = ConnectionError("Connection to the key-value server was lost")
+        try:
+            while True:
+                header = await self._reader.readexactly(FRAME_HEADER.size)
+                length, status, request_id = FRAME_HEADER.unpack(header)
+                payload = await self._reader.readexactly(length)
+                future = self._pending.get(request_id)
+                if future is not None and not future.done():
+                    future.set_result((status, payload))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            error = ConnectionError(f"Connection to the key-value server was lost: {e}")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+
+    async def close(self):
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+        await asyncio.gather(self._reader_task, return_exceptions=True)
+
+
+class AsyncKeyValueClient:
+    # Pool of pipelined connections to a KeyValueServer. Each request goes to the
+    # least busy connection; dead connections are replaced on the next request.
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, pool_size: int = 4,
+                 max_in_flight: int = 128):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.max_in_flight = max_in_flight # Per connection
+        self._connections: List[_Connection | None] = [None] * pool_size
+        self._connect_lock = asyncio.Lock()
+
+    async def __aenter__(self) -> "AsyncKeyValueClient":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def connect(self):
+        for index in range(self.pool_size):
+            await self._connection(index)
+
+    async def close(self):
+        connections = [connection for connection in self._connections if connection is not None]
+        self._connections = [None] * self.pool_size
+        await asyncio.gather(*(connection.close() for connection in connections))
+
+    async def _connection(self, index: int) -> _Connection:
+        connection = self._connections[index]
+        if connection is None or connection.closed:
+            async with self._connect_lock:
+                connection = self._connections[index]
+                if connection is None or connection.closed:
+                    reader, writer = await asyncio.open_connection(self.host, self.port)
+                    connection = _Connection(reader, writer, self.max_in_flight)
+                    self._connections[index] = connection
+        return connection
+
+    async def _request(self, opcode: int, payload: bytes = b"") -> bytes:
+        index = min(
+            range(self.pool_size),
+            key=lambda i: self._connections[i].load if self._connections[i] and not self._connections[i].closed else 0,
+        )
+        connection = await self._connection(index)
+        return await connection.request(opcode, payload)
+
+    async def _request_entries(self, opcode: int, entries: List[Tuple[int, str, str | None]]) -> List[Tuple[int, str, str | None]]:
+        return decode_entries(await self._request(opcode, encode_entries(entries)))
+
+    async def ping(self):
+        await self._request(OP_PING)
+
+    async def get(self, key: str) -> str | None:
+        ((status, _, value),) = await self._request_entries(OP_GET, [(ENTRY_OK, key, None)])
+        return value if status == ENTRY_OK else None
+
+    async def put(self, key: str, value: str):
+        await self._request_entries(OP_PUT, [(ENTRY_OK, key, value)])
+
+    async def delete(self, key: str) -> bool:
+        ((status, _, _),) = await self._request_entries(OP_DELETE, [(ENTRY_OK, key, None)])
+        return status == ENTRY_OK
+
+    async def mget(self, keys: List[str]) -> Dict[str, str | None]:
+        entries = await self._request_entries(OP_MGET, [(ENTRY_OK, key, None) for key in keys])
+        return self._batch_values(entries, {key: value if status == ENTRY_OK else None for status, key, value in entries})
+
+    async def mset(self, items: Dict[str, str]):
+        entries = await self._request_entries(OP_MSET, [(ENTRY_OK, key, value) for key, value in items.items()])
+        self._batch_values(entries, {key: True for status, key, _ in entries if status != ENTRY_ERROR})
+
+    async def mdelete(self, keys: List[str]) -> Dict[str, bool]:
+        entries = await self._request_entries(OP_MDELETE, [(ENTRY_OK, key, None) for key in keys])
+        return self._batch_values(entries, {key: status == ENTRY_OK for status, key, _ in entries})
+
+    @staticmethod
+    def _batch_values(entries: List[Tuple[int, str, str | None]], values: Dict[str, object]) -> Dict[str, object]:
+        errors = {key: value or "" for status, key, value in entries if status == ENTRY_ERROR}
+        if errors:
+            ok_values = {key: value for key, value in values.items() if key not in errors}
+            raise KeyValueClientError(f"{len(errors)} keys failed", errors=errors, values=ok_values)
+        return values
@@ -0,0 +1,71 @@
+import struct
+from typing import List, Tuple
+from ..storage_engine.encoding_pb2 import KeyValue, ValueData #type:ignore
+
+# Frame: payload length (4) | opcode or status (1) | request id (4) | payload
+# Requests and responses share the layout; a response echoes the request id, so a
+# connection can have many requests in flight and answers may come back in any order.
+FRAME_HEADER = struct.Struct(">IBI")
+DEFAULT_PORT = 7379
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+# Request opcodes
+OP_GET = 1
+OP_PUT = 2
+OP_DELETE = 3
+OP_MGET = 4
+OP_MSET = 5
+OP_MDELETE = 6
+OP_PING = 7
+
+# Response frame status; an error frame carries a utf-8 message as payload
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# Per-key status inside an OK response
+ENTRY_OK = 0
+ENTRY_NOT_FOUND = 1
+ENTRY_ERROR = 2 # value.data holds the error message
+
+# Payload entries: status (1) | message length (4) | serialized KeyValue.
+# Requests use the same entries with status ENTRY_OK; GET/DELETE send key-only KeyValues.
+ENTRY_HEADER = struct.Struct(">BI")
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_frame(code: int, request_id: int, payload: bytes = b"") -> bytes:
+    return FRAME_HEADER.pack(len(payload), code, request_id) + payload
+
+
+def encode_entries(entries: List[Tuple[int, str, str | None]]) -> bytes:
+    # (entry status, key, value or None)
+    parts = []
+    for status, key, value in entries:
+        kv_message = KeyValue(key=key)
+        if value is not None:
+            kv_message.value.CopyFrom(ValueData(data=value))
+        message = kv_message.SerializeToString()
+        parts.append(ENTRY_HEADER.pack(status, len(message)))
+        parts.append(message)
+    return b"".join(parts)
+
+
+def decode_entries(payload: bytes) -> List[Tuple[int, str, str | None]]:
+    entries = []
+    position = 0
+    while position < len(payload):
+        if position + ENTRY_HEADER.size > len(payload):
+            raise ProtocolError("truncated entry header")
+        status, length = ENTRY_HEADER.unpack_from(payload, position)
+        position += ENTRY_HEADER.size
+        if position + length > len(payload):
+            raise ProtocolError("truncated entry")
+        kv_message = KeyValue()
+        kv_message.ParseFromString(payload[position:position + length])
+        position += length
+        value = kv_message.value.data if kv_message.HasField("value") else None
+        entries.append((status, kv_message.key, value))
+    return entries
@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Set, Tuple
+from ..api import KeyValueStore
+from .protocol import (
+    DEFAULT_PORT, FRAME_HEADER, MAX_FRAME_BYTES, OP_GET, OP_PUT, OP_DELETE, OP_MGET, OP_MSET, OP_MDELETE, OP_PING,
+    STATUS_OK, STATUS_ERROR, ENTRY_OK, ENTRY_NOT_FOUND, ENTRY_ERROR,
+    ProtocolError, encode_frame, encode_entries, decode_entries,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class KeyValueServer:
+    # asyncio front end for a KeyValueStore. Each connection is read continuously and
+    # every request runs as its own task, so clients can pipeline; the store calls run
+    # on an offload thread pool because ColdStorage does blocking file I/O. Requests of
+    # one connection that share a key run in the order they were sent, the rest run
+    # concurrently and may complete out of order. A connection stops reading once
+    # max_in_flight of its requests are pending (backpressure), and responses wait for
+    # the socket to drain before more are written.
+    def __init__(self, store: KeyValueStore, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                 max_in_flight: int = 128, offload_workers: int | None = None):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.max_in_flight = max_in_flight
+        self._executor = ThreadPoolExecutor(max_workers=offload_workers, thread_name_prefix="kv-offload")
+        self._server: asyncio.AbstractServer | None = None
+        self._connections: Set[asyncio.Task] = set()
+        self._closed: asyncio.Future | None = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self._closed = asyncio.get_running_loop().create_future()
+        self.port = self._server.sockets[0].getsockname()[1] # Resolves port 0
+        logger.info("Key-Value server listening on %s:%s", self.host, self.port)
+
+    async def serve_forever(self):
+        # Runs until close() or until cancelled. Not Server.serve_forever: cancelling that waits
+        # for every connection to drop (3.12+), and the connections are only ended by close()
+        if self._server is None:
+            await self.start()
+        await self._closed
+
+    async def close(self):
+        # Stop accepting, then end the open connections: wait_closed waits for their
+        # handlers (3.12+), so it only returns once those are cancelled
+        if self._server is not None:
+            self._server.close()
+            if not self._closed.done():
+                self._closed.set_result(None)
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+        self._executor.shutdown(wait=True)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(asyncio.current_task())
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        write_lock = asyncio.Lock()
+        requests: Set[asyncio.Task] = set()
+        latest: Dict[str, asyncio.Task] = {} # Key -> last request of this connection using it
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                length, opcode, request_id = FRAME_HEADER.unpack(header)
+                if length > MAX_FRAME_BYTES:
+                    await self._respond(writer, write_lock, encode_frame(
+                        STATUS_ERROR, request_id, f"Frame of {length} bytes exceeds the limit".encode("utf-8")))
+                    break # The stream can't be resynchronized after skipping the check
+                payload = await reader.readexactly(length)
+                try:
+                    entries = [] if opcode == OP_PING else decode_entries(payload)
+                except Exception as e:
+                    await self._respond(writer, write_lock, encode_frame(STATUS_ERROR, request_id, str(e).encode("utf-8")))
+                    continue
+                keys = {key for _, key, _ in entries}
+                before = {latest[key] for key in keys if key in latest}
+                await in_flight.acquire()
+                task = asyncio.create_task(self._process(writer, write_lock, opcode, request_id, entries, before))
+                for key in keys:
+                    latest[key] = task
+                requests.add(task)
+                task.add_done_callback(requests.discard)
+                task.add_done_callback(lambda _: in_flight.release())
+                task.add_done_callback(functools.partial(self._forget, latest, keys))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass # Client went away
+        except asyncio.CancelledError:
+            # Server is closing. The handler returns normally instead of ending cancelled, which
+            # asyncio's stream callback would log as an error. Requests still running in the
+            # offload pool can't be interrupted; their responses are dropped with the connection.
+            for task in requests:
+                task.cancel()
+            writer.transport.abort()
+        finally:
+            if requests:
+                await asyncio.gather(*requests, return_exceptions=True)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            self._connections.discard(asyncio.current_task())
+
+    @staticmethod
+    def _forget(latest: Dict[str, asyncio.Task], keys: Set[str], task: asyncio.Task):
+        for key in keys:
+            if latest.get(key) is task:
+                del latest[key]
+
+    async def _process(self, writer: asyncio.StreamWriter, write_lock: asyncio.Lock, opcode: int,
+                       request_id: int, entries: List[Tuple[int, str, str | None]], before: Set[asyncio.Task]):
+        loop = asyncio.get_running_loop()
+        if before:
+            await asyncio.wait(before) # Earlier requests on the same keys
+        try:
+            response = await loop.run_in_executor(self._executor, self._execute, opcode, entries)
+            frame = encode_frame(STATUS_OK, request_id, response)
+        except Exception as e:
+            frame = encode_frame(STATUS_ERROR, request_id, str(e).encode("utf-8"))
+        try:
+            await self._respond(writer, write_lock, frame)
+        except ConnectionError:
+            pass
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, write_lock: asyncio.Lock, frame: bytes):
+        async with write_lock:
+            writer.write(frame)
+            await writer.drain()
+
+    def _execute(self, opcode: int, entries: List[Tuple[int, str, str | None]]) -> bytes:
+        # Runs on the offload pool
+        if opcode == OP_PING:
+            return b""
+        keys = [key for _, key, _ in entries]
+        if opcode == OP_GET:
+            (key,) = keys
+            value = self.store.get(key)
+            return encode_entries([(ENTRY_OK if value is not None else ENTRY_NOT_FOUND, key, value)])
+        if opcode == OP_PUT:
+            ((_, key, value),) = entries
+            self.store.put(key, value or "")
+            return encode_entries([(ENTRY_OK, key, None)])
+        if opcode == OP_DELETE:
+            (key,) = keys
+            return encode_entries([(ENTRY_OK if self.store.delete(key) else ENTRY_NOT_FOUND, key, None)])
+        if opcode == OP_MGET:
+            result = self.store.get_many(keys)
+            return encode_entries(self._batch_entries(keys, result.values, result.errors, with_values=True))
+        if opcode == OP_MSET:
+            result = self.store.put_many({key: value or "" for _, key, value in entries})
+            return encode_entries(self._batch_entries(keys, result.values, result.errors))
+        if opcode == OP_MDELETE:
+            result = self.store.delete_many(keys)
+            return encode_entries(self._batch_entries(keys, result.values, result.errors))
+        raise ProtocolError(f"Unknown opcode {opcode}")
+
+    @staticmethod
+    def _batch_entries(keys: List[str], values: dict, errors: dict, with_values: bool = False) -> List[Tuple[int, str, str | None]]:
+        entries = []
+        for key in dict.fromkeys(keys):
+            if key in errors:
+                entries.append((ENTRY_ERROR, key, str(errors[key])))
+            elif with_values:
+                value = values.get(key)
+                entries.append((ENTRY_OK if value is not None else ENTRY_NOT_FOUND, key, value))
+            else:
+                entries.append((ENTRY_OK if values.get(key) else ENTRY_NOT_FOUND, key, None))
+        return entries
+
+
+async def _main(args: argparse.Namespace):
+    store = KeyValueStore(num_shards=args.shards, write_back=args.write_back, workers=args.workers)
+    server = KeyValueServer(store, host=args.host, port=args.port, max_in_flight=args.max_in_flight,
+                            offload_workers=args.offload_workers)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+        store.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a KeyValueStore over TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--shards", type=int, default=None, help="Defaults to the layout saved in the data directory")
+    parser.add_argument("--write-back", action="store_true")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes hosting the shards")
+    parser.add_argument("--max-in-flight", type=int, default=128, help="Pipelined requests per connection")
+    parser.add_argument("--offload-workers", type=int, default=None, help="Threads running store calls")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,34 @@
+# partitioning/ring_state.py
+import json
+import os
+from typing import Any, Dict
+from .sharder import Sharder
+
+# Ring layout of a store, kept next to the shard directories so a restart routes keys
+# the same way the previous run stored them. "resharding" is set while keys move
+# between shards and cleared once they all have.
+RING_FILENAME = "ring.json"
+
+
+def load_ring_state(cold_dir: str) -> Dict[str, Any] | None:
+    path = os.path.join(cold_dir, RING_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    state["sharder"] = Sharder.from_weights(
+        {int(shard_id): weight for shard_id, weight in state["weights"].items()}, vnodes=state["vnodes"]
+    )
+    return state
+
+
+def save_ring_state(cold_dir: str, sharder: Sharder, resharding: bool = False):
+    os.makedirs(cold_dir, exist_ok=True)
+    path = os.path.join(cold_dir, RING_FILENAME)
+    state = {"vnodes": sharder.vnodes, "weights": {str(shard_id): weight for shard_id, weight in sharder.weights.items()},
+             "resharding": resharding}
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
@@ -1,7 +1,64 @@
 # partitioning/sharder.py
+import bisect
+import hashlib
+from typing import Dict, List
+
+DEFAULT_VNODES = 128 # Virtual nodes per shard at weight 1.0
+
+
+def stable_hash(key: str) -> int:
+    # Same value in every process, unlike the built-in hash() which is salted per run
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
 class Sharder:
-    def __init__(self, num_shards: int):
-        self.num_shards = num_shards
+    # Consistent-hash ring. Each shard owns round(vnodes * weight) points on the
+    # ring and a key belongs to the first point at or after its hash, so adding
+    # or removing a shard only moves the keys of the ring arcs it gains or loses.
+    def __init__(self, num_shards: int, vnodes: int = DEFAULT_VNODES, weights: Dict[int, float] | None = None):
+        self.vnodes = vnodes
+        self.weights: Dict[int, float] = {shard_id: 1.0 for shard_id in range(num_shards)}
+        if weights:
+            self.weights.update(weights)
+        self.num_shards = len(self.weights)
+        self._ring_hashes: List[int] = []
+        self._ring_shards: List[int] = []
+        self._build_ring()
+
+    @classmethod
+    def from_weights(cls, weights: Dict[int, float], vnodes: int = DEFAULT_VNODES) -> "Sharder":
+        return cls(0, vnodes=vnodes, weights=weights)
+
+    def _build_ring(self):
+        points = []
+        for shard_id, weight in self.weights.items():
+            if weight <= 0:
+                raise ValueError(f"Shard {shard_id} needs a positive weight, got {weight}")
+            for vnode in range(max(1, round(self.vnodes * weight))):
+                points.append((stable_hash(f"shard-{shard_id}-vnode-{vnode}"), shard_id))
+        points.sort()
+        self._ring_hashes = [point for point, _ in points]
+        self._ring_shards = [shard_id for _, shard_id in points]
 
     def get_shard_id(self, key: str) -> int:
-        return hash(key) % self.num_shards
\ No newline at end of file
+        index = bisect.bisect_left(self._ring_hashes, stable_hash(key))
+        if index == len(self._ring_hashes):
+            index = 0 # Wrap around the ring
+        return self._ring_shards[index]
+
+    @property
+    def shard_ids(self) -> List[int]:
+        return sorted(self.weights)
+
+    def with_shard(self, shard_id: int, weight: float = 1.0) -> "Sharder":
+        if shard_id in self.weights:
+            raise ValueError(f"Shard {shard_id} is already on the ring")
+        return Sharder.from_weights({**self.weights, shard_id: weight}, vnodes=self.vnodes)
+
+    def without_shard(self, shard_id: int) -> "Sharder":
+        if shard_id not in self.weights:
+            raise ValueError(f"Shard {shard_id} is not on the ring")
+        if len(self.weights) == 1:
+            raise ValueError("Cannot remove the last shard")
+        weights = {other: weight for other, weight in self.weights.items() if other != shard_id}
+        return Sharder.from_weights(weights, vnodes=self.vnodes)
@@ -1,66 +1,467 @@
-from typing import List, Dict
-from ..storage_engine.hot_storage import HotStorage
-from ..storage_engine.cold_storage import ColdStorage
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, List, Dict, Tuple
+from ..storage_engine.hot_storage import HotStorage, DEFAULT_MAX_ENTRIES, DEFAULT_MAX_BYTES
+from ..storage_engine.cold_storage import ColdStorage, DEFAULT_BLOOM_CAPACITY, DEFAULT_BLOOM_FALSE_POSITIVE_RATE
+from ..storage_engine.wal import WriteAheadLog
 from ..storage_engine.encoding_pb2 import ValueData #type:ignore
+from ..metrics.registry import MetricsRegistry, ShardMetrics
+
+logger = logging.getLogger(__name__)
+
+# Replicated writes: key -> (value, timestamp), a None value is a delete
+Writes = Dict[str, Tuple[ValueData | None, int]]
+
+
+class QuorumNotReachedError(Exception):
+    pass
+
 
 class ReplicationManager:
-    def __init__(self, shard_id: int, total_shards: int, base_cold_dir: str = "cold_data"):
+    def __init__(self, shard_id: int, total_shards: int, base_cold_dir: str = "cold_data",
+                 hot_max_entries: int | None = DEFAULT_MAX_ENTRIES, hot_max_bytes: int | None = DEFAULT_MAX_BYTES,
+                 eviction_policy: str = "lru",
+                 write_quorum: int | str = "all", # Replica acks a write waits for: 1..replicas or "all"
+                 read_quorum: int | str = 1, # Replicas a cold read consults: 1..replicas or "all"
+                 write_back: bool = False, # Ack puts once they are in hot storage and the WAL
+                 wal_commit_window: float = 0.001, # Seconds a WAL group commit waits for more writers
+                 flush_interval: float = 1.0, # Seconds between background flushes in write-back mode
+                 bloom_capacity: int = DEFAULT_BLOOM_CAPACITY, # Initial keys per replica filter, it grows past that
+                 bloom_false_positive_rate: float = DEFAULT_BLOOM_FALSE_POSITIVE_RATE,
+                 metrics: ShardMetrics | None = None):
         self.shard_id = shard_id
         self.total_shards = total_shards
-        self.hot_storage = HotStorage()
+        self.metrics = metrics or MetricsRegistry().shard(shard_id)
+        self.hot_storage = HotStorage(
+            max_entries=hot_max_entries, max_bytes=hot_max_bytes, policy=eviction_policy, on_evict=self._demote
+        )
         # Each replica will have its own cold storage directory
-        self.cold_storage = ColdStorage(f"{base_cold_dir}/shard_{shard_id}_replica_0")
-        self.replica_cold_storage = ColdStorage(f"{base_cold_dir}/shard_{shard_id}_replica_1")
+        bloom_options = {"bloom_capacity": bloom_capacity, "bloom_false_positive_rate": bloom_false_positive_rate}
+        self.cold_storage = ColdStorage(f"{base_cold_dir}/shard_{shard_id}_replica_0", **bloom_options)
+        self.replica_cold_storage = ColdStorage(f"{base_cold_dir}/shard_{shard_id}_replica_1", **bloom_options)
         # In a real system, replica_cold_storage would be on a different node/machine
+        self.replicas: List[ColdStorage] = [self.cold_storage, self.replica_cold_storage]
 
-    def put_data(self, key: str, value_data_pb2: ValueData):
-        # Write to primary hot storage
-        self.hot_storage.put(key, value_data_pb2)
-        # Write to primary cold storage
-        self.cold_storage.put(key, value_data_pb2)
+        self.write_quorum = self._quorum_size(write_quorum)
+        self.read_quorum = self._quorum_size(read_quorum)
+        # One single-threaded executor per replica: writes reach every replica in the
+        # same order, and a slow replica only delays its own queue
+        self._replica_executors = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"shard{shard_id}-replica{index}")
+            for index in range(len(self.replicas))
+        ]
+        self._read_executor = ThreadPoolExecutor(max_workers=len(self.replicas), thread_name_prefix=f"shard{shard_id}-read")
+        # Hinted handoff: writes a replica failed to apply, replayed before its next write
+        self._backlogs: List[Writes] = [{} for _ in self.replicas]
+        self._backlog_lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._clock_lock = threading.Lock()
+        # Never stamp a write older than what the replicas already hold, even if the clock went
+        # back across a restart, or apply_many would skip it as outdated
+        self._last_timestamp = max(replica._last_timestamp for replica in self.replicas)
+        # Set once the newest stamped write is done with hot storage, see _take_hot_turn
+        self._hot_turn = threading.Event()
+        self._hot_turn.set()
+        self.read_repairs = 0
+        self.quorum_failures = 0
+
+        # Write-back mode: puts go to hot storage (dirty) and a per-shard WAL, and a background
+        # flusher moves dirty entries to the cold replicas and then drops the flushed WAL
+        self.write_back = write_back
+        self.flush_interval = flush_interval
+        self.wal: WriteAheadLog | None = None
+        self._flush_lock = threading.Lock() # Keeps deletes from interleaving with a flush
+        self._flusher_stop = threading.Event()
+        self._flusher: threading.Thread | None = None
+        if write_back:
+            self.wal = WriteAheadLog(f"{base_cold_dir}/shard_{shard_id}_wal", commit_window=wal_commit_window)
+            self._replay_wal()
+            self._flusher = threading.Thread(target=self._flush_loop, name=f"shard{shard_id}-flusher", daemon=True)
+            self._flusher.start()
 
-        # Synchronous replication to the second replica
-        # In a real distributed system, this would be a network call to another node
-        self.replica_cold_storage.put(key, value_data_pb2)
-        print(f"Shard {self.shard_id}: Key '{key}' replicated to primary and secondary cold storage.")
+    def _quorum_size(self, quorum: int | str) -> int:
+        if quorum == "all":
+            return len(self.replicas)
+        if not isinstance(quorum, int) or not 1 <= quorum <= len(self.replicas):
+            raise ValueError(f"Quorum must be 'all' or between 1 and {len(self.replicas)}, got {quorum!r}")
+        return quorum
+
+    def put_data(self, key: str, value_data_pb2: ValueData):
+        if self.write_back:
+            self._put_write_back({key: value_data_pb2})
+            return
+        # Replicate to the cold replicas first, so a write that misses its quorum is never served from hot
+        # In a real distributed system, each replica write would be a network call to another node
+        self._replicate({key: value_data_pb2}, lambda: self.hot_storage.put(key, value_data_pb2))
 
     def get_data(self, key: str):
         # Try hot storage first
-        data = self.hot_storage.get(key)
-        if data:
-            return data
-
-        # If not in hot storage, try primary cold storage
-        data = self.cold_storage.get(key)
+        found, token = self.hot_storage.lookup([key])
+        data = found[key]
         if data:
-            # Optionally, promote to hot storage on read
-            self.hot_storage.put(key, data)
+            self.metrics.incr("hot_hits")
             return data
 
-        # If still not found, try replica cold storage (for robustness, though primary should have it)
-        data = self.replica_cold_storage.get(key)
+        # If not in hot storage, read the cold replicas and promote what they return. The
+        # fill skips the key if a write or delete raced with the cold read.
+        promoted = {}
+        try:
+            data = self._read_cold([key])[key]
+            if data:
+                promoted[key] = data
+        finally:
+            self.hot_storage.fill_many(promoted, token)
         if data:
-            self.hot_storage.put(key, data) # Promote
+            self.metrics.incr("cold_hits")
+            self.metrics.incr("promotions")
             return data
+        self.metrics.incr("misses")
         return None
 
+    def put_many(self, items: Dict[str, ValueData]):
+        # Same as put_data for a whole batch: one write per storage instead of one per key
+        if self.write_back:
+            self._put_write_back(items)
+            return
+        self._replicate(items, lambda: self.hot_storage.put_many(items))
+
+    def get_many(self, keys: List[str]) -> Dict[str, ValueData | None]:
+        found, token = self.hot_storage.lookup(keys)
+        missing = [key for key, data in found.items() if not data]
+        self.metrics.incr("hot_hits", len(found) - len(missing))
+        if missing:
+            promoted = {}
+            try:
+                promoted = {key: data for key, data in self._read_cold(missing).items() if data}
+                found.update(promoted)
+            finally:
+                self.hot_storage.fill_many(promoted, token)
+            self.metrics.incr("cold_hits", len(promoted))
+            self.metrics.incr("promotions", len(promoted))
+            self.metrics.incr("misses", len(missing) - len(promoted))
+        return found
+
+    def delete_many(self, keys: List[str]) -> Dict[str, bool]:
+        if not self.write_back:
+            in_hot = self.hot_storage.remove_many(keys)
+            # Removed again in turn, in case an older put reached hot storage in between. The fence
+            # keeps cold reads that started before the delete from promoting.
+            in_cold = self._replicate(dict.fromkeys(keys), lambda: self._remove_and_fence(keys))
+            return {key: in_hot[key] or in_cold[key] for key in keys}
+        # Deletes stay write-through. The WAL tombstone stops a replay from bringing back an
+        # older unflushed put, and the flush lock stops a running flush from doing the same.
+        with self._flush_lock:
+            with self._submit_lock:
+                timestamp = self._next_timestamp()
+                previous, turn = self._take_hot_turn()
+            try:
+                previous.wait()
+                in_hot = self.hot_storage.remove_many(keys)
+            finally:
+                turn.set()
+            writes = {key: (None, timestamp) for key in keys}
+            self.wal.append(writes)
+            in_cold = self._replicate_writes(writes)
+            self.hot_storage.fence(keys)
+        return {key: in_hot[key] or in_cold[key] for key in keys}
+
+    def _remove_and_fence(self, keys: List[str]):
+        self.hot_storage.remove_many(keys)
+        self.hot_storage.fence(keys)
+
+    def delete_data(self, key: str) -> bool:
+        return self.delete_many([key])[key]
+
+    def get_all_keys(self) -> List[str]:
+        keys = set(self.hot_storage.get_all_keys())
+        for replica in self.replicas:
+            keys.update(replica.keys())
+        return list(keys)
+
+    # --- Replication ---
+
+    def _next_timestamp(self) -> int:
+        with self._clock_lock:
+            self._last_timestamp = max(time.time_ns(), self._last_timestamp + 1)
+            return self._last_timestamp
+
+    def _take_hot_turn(self) -> Tuple[threading.Event, threading.Event]:
+        # Caller holds _submit_lock and just took a timestamp. Returns (previous, turn): wait for
+        # previous before touching hot storage and set turn afterwards, also on failure, so hot
+        # storage sees writes in timestamp order however their replication finishes
+        previous, self._hot_turn = self._hot_turn, threading.Event()
+        return previous, self._hot_turn
+
+    def _replicate(self, values: Dict[str, ValueData | None], update_hot: Callable[[], None] | None = None) -> Dict[str, bool]:
+        # Replicates new writes stamped with the current time, then runs update_hot in timestamp
+        # order once the quorum acknowledged. The timestamp is taken under the submit lock so
+        # timestamp order and the order replicas apply writes agree.
+        started = time.perf_counter()
+        with self._submit_lock:
+            timestamp = self._next_timestamp()
+            futures = self._submit_writes({key: (value_data_pb2, timestamp) for key, value_data_pb2 in values.items()})
+            previous, turn = self._take_hot_turn()
+        try:
+            present = self._await_writes(futures, list(values), started)
+            previous.wait()
+            if update_hot is not None:
+                update_hot()
+            return present
+        finally:
+            previous.wait()
+            turn.set()
+
+    def _replicate_writes(self, writes: Writes) -> Dict[str, bool]:
+        # Replicates writes that already carry their timestamps (flushes, demotions, replays)
+        started = time.perf_counter()
+        with self._submit_lock:
+            futures = self._submit_writes(writes)
+        return self._await_writes(futures, list(writes), started)
+
+    def _submit_writes(self, writes: Writes) -> List[Future]:
+        # Caller holds _submit_lock
+        return [
+            executor.submit(self._write_replica, index, writes)
+            for index, executor in enumerate(self._replica_executors)
+        ]
+
+    def _await_writes(self, futures: List[Future], keys: List[str], started: float) -> Dict[str, bool]:
+        # Returns once write_quorum replicas acknowledged, the rest finish in the background.
+        # The result says whether each key existed on any acknowledging replica.
+        results = self._await_quorum(futures, self.write_quorum, "write")
+        self.metrics.observe("replicate", time.perf_counter() - started)
+        return {key: any(present[key] for present in results) for key in keys}
+
+    def _await_quorum(self, futures: List[Future], required: int, operation: str) -> List[Any]:
+        results = []
+        errors = []
+        pending = set(futures)
+        while pending and len(results) < required:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    results.append(future.result())
+                else:
+                    errors.append(future.exception())
+        if len(results) < required:
+            self.quorum_failures += 1
+            raise QuorumNotReachedError(
+                f"Shard {self.shard_id}: {operation} acknowledged by {len(results)} of {required} required replicas: {errors}"
+            )
+        return results
+
+    def _write_replica(self, index: int, writes: Writes) -> Dict[str, bool]:
+        # Runs on the replica's own executor thread, the only place its backlog is drained
+        replica = self.replicas[index]
+        with self._backlog_lock:
+            backlog = dict(self._backlogs[index])
+        try:
+            if backlog:
+                replica.apply_many(backlog)
+                with self._backlog_lock:
+                    self._backlogs[index].clear()
+                self.metrics.incr("hinted_replays", len(backlog))
+                logger.info("Shard %s: replayed %d hinted writes to replica %d.", self.shard_id, len(backlog), index)
+            return replica.apply_many(writes)
+        except Exception:
+            with self._backlog_lock:
+                self._backlogs[index].update(writes)
+            raise
+
+    def replay_backlogs(self) -> int:
+        # Retries the hinted writes of every lagging replica, returns how many are still pending
+        futures = [
+            self._replica_executors[index].submit(self._write_replica, index, {})
+            for index in range(len(self.replicas)) if self._backlogs[index]
+        ]
+        wait(futures)
+        with self._backlog_lock:
+            return sum(len(backlog) for backlog in self._backlogs)
+
+    def _read_replica(self, index: int, keys: List[str], candidates: List[str]) -> Tuple[int, Dict[str, Tuple[ValueData | None, int]]]:
+        # Only the candidates are looked up, the rest of keys count as never written
+        versions = {key: (None, 0) for key in keys}
+        if candidates:
+            versions.update(self.replicas[index].get_many_versioned(candidates))
+        return index, versions
+
+    def _read_cold(self, keys: List[str]) -> Dict[str, ValueData | None]:
+        started = time.perf_counter()
+        responses: Dict[int, Dict[str, Tuple[ValueData | None, int]]] = {}
+        if self.read_quorum == 1:
+            # Primary first; other replicas only for what it misses (or if it fails). Read inline,
+            # so the keydir answers a miss faster than the Bloom filter could.
+            missing = keys
+            for index in range(len(self.replicas)):
+                try:
+                    _, responses[index] = self._read_replica(index, missing, missing)
+                except Exception as e:
+                    self.metrics.incr("replica_read_errors")
+                    logger.warning("Shard %s: read from replica %d failed: %s", self.shard_id, index, e)
+                    continue
+                missing = [key for key in missing if responses[index][key][0] is None]
+                if not missing:
+                    break
+        else:
+            # Replicas whose filter rules out every key answer right away, without a thread hop
+            futures = []
+            for index, replica in enumerate(self.replicas):
+                candidates = [key for key in keys if replica.might_contain(key)]
+                if candidates:
+                    futures.append(self._read_executor.submit(self._read_replica, index, keys, candidates))
+                else:
+                    responses[index] = {key: (None, 0) for key in keys}
+            if len(responses) < self.read_quorum:
+                responses.update(self._await_quorum(futures, self.read_quorum - len(responses), "read"))
+
+        latest: Dict[str, Tuple[ValueData | None, int]] = {key: (None, 0) for key in keys}
+        for versions in responses.values():
+            for key, (data, timestamp) in versions.items():
+                if timestamp > latest[key][1]:
+                    latest[key] = (data, timestamp)
+
+        # A hinted write is the newest version of its key (it may be a delete the replicas that
+        # answered already applied); leave those keys to the backlog replay instead of repairing
+        hinted = set()
+        with self._backlog_lock:
+            for backlog in self._backlogs:
+                for key in keys:
+                    if key in backlog and backlog[key][1] >= latest[key][1]:
+                        latest[key] = backlog[key]
+                        hinted.add(key)
+
+        self._read_repair(responses, latest, hinted)
+        primary = responses.get(0, {})
+        self.metrics.incr("replica_fallbacks", sum(
+            1 for key, (data, timestamp) in latest.items()
+            if data is not None and primary.get(key, (None, 0))[1] < timestamp
+        ))
+        self.metrics.observe("cold_read", time.perf_counter() - started)
+        return {key: data for key, (data, _) in latest.items()}
+
+    def _read_repair(self, responses: Dict[int, Dict[str, Tuple[ValueData | None, int]]],
+                     latest: Dict[str, Tuple[ValueData | None, int]], hinted: set):
+        # Push the newest version to replicas that answered with an older one or none at all.
+        # Deletes are not tracked once applied, so a missing key never overrides a present one.
+        for index, versions in responses.items():
+            repairs = {
+                key: latest[key] for key, (_, timestamp) in versions.items()
+                if key not in hinted and latest[key][0] is not None and timestamp < latest[key][1]
+            }
+            if repairs:
+                self.read_repairs += len(repairs)
+                self._replica_executors[index].submit(self._write_replica, index, repairs)
+
+    def hot_stats(self) -> Dict[str, int]:
+        return self.hot_storage.stats()
+
+    def bloom_stats(self) -> List[Dict[str, int]]:
+        return [replica.bloom_stats() for replica in self.replicas]
+
+    def replication_stats(self) -> Dict[str, Any]:
+        with self._backlog_lock:
+            backlog = [len(backlog) for backlog in self._backlogs]
+        return {"backlog": backlog, "read_repairs": self.read_repairs, "quorum_failures": self.quorum_failures}
+
+    # --- Write-back mode ---
+
+    def _put_write_back(self, items: Dict[str, ValueData]):
+        # Hot first, then the WAL: by the time a record can land in a WAL generation the
+        # entry is already dirty in hot storage, so a flush that starts after rotating the
+        # WAL always picks it up before the generation is dropped
+        with self._submit_lock:
+            timestamp = self._next_timestamp()
+            previous, turn = self._take_hot_turn()
+        try:
+            previous.wait()
+            self.hot_storage.put_many(items, dirty=True, timestamp=timestamp)
+        finally:
+            turn.set()
+        started = time.perf_counter()
+        self.wal.append({key: (value_data_pb2, timestamp) for key, value_data_pb2 in items.items()})
+        self.metrics.observe("wal_append", time.perf_counter() - started)
+
+    def _replay_wal(self):
+        # Rebuild the dirty part of the hot tier from writes that never reached cold storage
+        latest: Writes = {}
+        for key, value_data_pb2, timestamp in self.wal.replay():
+            if key not in latest or timestamp >= latest[key][1]:
+                latest[key] = (value_data_pb2, timestamp)
+            self._last_timestamp = max(self._last_timestamp, timestamp)
+        if not latest:
+            return
+        deletes = {key: write for key, write in latest.items() if write[0] is None}
+        if deletes:
+            self._replicate_writes(deletes)
+        for key, (value_data_pb2, timestamp) in latest.items():
+            if value_data_pb2 is not None:
+                self.hot_storage.put(key, value_data_pb2, dirty=True, timestamp=timestamp)
+        logger.info("Shard %s: replayed %d keys from the WAL.", self.shard_id, len(latest))
+        self._flush_dirty()
+
+    def _flush_loop(self):
+        while not self._flusher_stop.wait(self.flush_interval):
+            try:
+                self._flush_dirty()
+            except Exception as e:
+                logger.warning("Shard %s: background flush failed, will retry: %s", self.shard_id, e)
+
+    def _flush_dirty(self) -> int:
+        # Writes every dirty hot entry to the cold replicas with the timestamp it was
+        # written with (so it never overwrites a newer version), then drops the WAL
+        # generations those entries came from
+        with self._flush_lock:
+            started = time.perf_counter()
+            sealed = self.wal.rotate() if self.wal is not None else None
+            dirty = self.hot_storage.dirty_items()
+            if dirty:
+                self._replicate_writes(dirty)
+                self.hot_storage.mark_clean({key: timestamp for key, (_, timestamp) in dirty.items()})
+            if sealed is not None:
+                self.wal.truncate(sealed)
+            self.metrics.incr("flushed_keys", len(dirty))
+            self.metrics.observe("flush", time.perf_counter() - started)
+            return len(dirty)
+
+    def _stop_flusher(self):
+        if self._flusher is not None:
+            self._flusher_stop.set()
+            self._flusher.join()
+            self._flusher = None
+
     # Add methods for handling data movement between hot/cold based on access patterns
     # For this project, you can start simple: data written to hot and cold,
     # and on read from cold, it's moved to hot.
     def move_to_cold(self, key: str):
         # Example: move data from hot to cold if not accessed for a while
-        value = self.hot_storage.get(key)
-        if value:
-            self.hot_storage.remove(key)
-            self.cold_storage.put(key, value)
-            self.replica_cold_storage.put(key, value) # Replicate the move
-            print(f"Key '{key}' moved from hot to cold storage on shard {self.shard_id}.")
-
-    def flush_hot_to_cold(self):
-        # Periodically flush all hot data to cold storage for persistence
-        for key in self.hot_storage.get_all_keys():
+        with self._flush_lock:
             value = self.hot_storage.get(key)
             if value:
-                self.cold_storage.put(key, value)
-                self.replica_cold_storage.put(key, value)
-        print(f"Shard {self.shard_id}: All hot data flushed to cold storage.")
\ No newline at end of file
+                self.hot_storage.remove(key)
+                self._replicate({key: value}) # Replicate the move
+                logger.info("Key '%s' moved from hot to cold storage on shard %s.", key, self.shard_id)
+
+    def _demote(self, key: str, value_data_pb2: ValueData, timestamp: int):
+        # Called by HotStorage for evicted entries that are not in cold storage yet
+        self._replicate_writes({key: (value_data_pb2, timestamp)})
+        self.metrics.incr("demotions")
+
+    def flush_hot_to_cold(self):
+        # Final flush of everything not in cold storage yet; in write-back mode the
+        # background flusher does this continuously and is stopped here
+        self._stop_flusher()
+        flushed = self._flush_dirty()
+        logger.info("Shard %s: All hot data flushed to cold storage (%d dirty keys).", self.shard_id, flushed)
+
+    def close(self):
+        self._stop_flusher()
+        # Let queued replica writes land before closing the storages
+        for executor in self._replica_executors:
+            executor.shutdown(wait=True)
+        self._read_executor.shutdown(wait=True)
+        if self.wal is not None:
+            self.wal.close()
+        for replica in self.replicas:
+            replica.close()
@@ -0,0 +1,59 @@
+import hashlib
+import math
+import struct
+from typing import Tuple
+
+# File layout: header then the bit array. The marker is opaque to the filter; ColdStorage
+# stores the end of its log there to tell whether the file is still current.
+BLOOM_HEADER = struct.Struct(">4sQdQIQQQ")
+BLOOM_MAGIC = b"BLM1"
+
+
+class BloomFilter:
+    # Set membership with no false negatives and a false-positive rate close to
+    # false_positive_rate while at most `capacity` keys have been added.
+    def __init__(self, capacity: int, false_positive_rate: float = 0.01):
+        if not 0 < false_positive_rate < 1:
+            raise ValueError(f"false_positive_rate must be between 0 and 1, got {false_positive_rate}")
+        self.capacity = max(capacity, 1)
+        self.false_positive_rate = false_positive_rate
+        self.num_bits = max(8, math.ceil(-self.capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key: str):
+        # Double hashing: position i is h1 + i * h2, both halves of one 128-bit digest
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def might_contain(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def to_bytes(self, marker: Tuple[int, int] = (0, 0)) -> bytes:
+        header = BLOOM_HEADER.pack(BLOOM_MAGIC, self.capacity, self.false_positive_rate, self.num_bits,
+                                   self.num_hashes, self.count, marker[0], marker[1])
+        return header + bytes(self._bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Tuple["BloomFilter", Tuple[int, int]]:
+        magic, capacity, false_positive_rate, num_bits, num_hashes, count, marker_segment, marker_size = \
+            BLOOM_HEADER.unpack_from(data)
+        if magic != BLOOM_MAGIC:
+            raise ValueError("not a bloom filter file")
+        bloom = cls(capacity, false_positive_rate)
+        bits = data[BLOOM_HEADER.size:]
+        if bloom.num_bits != num_bits or bloom.num_hashes != num_hashes or len(bits) != len(bloom._bits):
+            raise ValueError("bloom filter file does not match its header")
+        bloom._bits = bytearray(bits)
+        bloom.count = count
+        return bloom, (marker_segment, marker_size)
@@ -1,45 +1,576 @@
+import logging
 import os
+import struct
+import threading
+import time
+from typing import Dict, List, NamedTuple, Tuple
 from .encoding_pb2 import KeyValue, ValueData #type:ignore
+from .encoding import RECORD_HEADER, FLAG_TOMBSTONE, CorruptRecordError, decode_header, decode_record, encode_record
+from .bloom_filter import BloomFilter
 
-_CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-print(f"[DEBUG PATH] _CURRENT_DIR: {_CURRENT_DIR}")
+logger = logging.getLogger(__name__)
 
+_CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.normpath(os.path.join(_CURRENT_DIR, "..")) # Tambahkan os.path.normpath
-print(f"[DEBUG PATH] PROJECT_ROOT (normalized): {PROJECT_ROOT}")
-
 COLD_STORAGE_DIR = os.path.join(PROJECT_ROOT, "cold_data")
-print(f"[DEBUG PATH] COLD_STORAGE_DIR (final): {COLD_STORAGE_DIR}")
+
+DATA_SUFFIX = ".data"
+HINT_SUFFIX = ".hint"
+LEGACY_SUFFIX = ".bin" # Older layout: one {key}.bin file per key
+BLOOM_FILENAME = "bloom.filter"
+DEFAULT_BLOOM_CAPACITY = 100_000
+DEFAULT_BLOOM_FALSE_POSITIVE_RATE = 0.01
+
+# Hint file: magic, then per record: timestamp | flags | record offset | record length | key length | key.
+# Hint files without the magic (older layout with a 2-byte key length) are ignored and the
+# segment is scanned instead.
+HINT_MAGIC = b"HNT2"
+HINT_ENTRY = struct.Struct(">QBQII")
+
+# (key, timestamp, flags, offset, length) of one record inside a segment
+SegmentEntry = Tuple[str, int, int, int, int]
+
+
+class KeyDirEntry(NamedTuple):
+    segment_id: int
+    offset: int
+    length: int
+    timestamp: int
+    tombstone: bool = False # Deleted at timestamp; kept so a replicated older write can't revive the key
+
 
 class ColdStorage:
-    def __init__(self, storage_dir: str = COLD_STORAGE_DIR):
+    # Bitcask-style log-structured storage. Every put/delete is appended to the
+    # active segment file, and an in-memory keydir maps each key to the location
+    # of its latest record, so a get is one dict lookup plus one pread.
+    # Segments that are no longer active get a hint file (the keydir entries of
+    # that segment) so startup does not have to scan the data, and are merged
+    # in the background to drop overwritten and deleted records once enough of
+    # the sealed data is garbage.
+    # Deletes stay in the keydir as tombstones carrying their timestamp, so last-writer-wins
+    # comparisons between replicas see them; compaction drops a tombstone once it is older
+    # than tombstone_grace seconds.
+    # A Bloom filter over the keys with a version here (live or deleted) lets callers rule
+    # out a key before touching the store; it is saved on close and rebuilt when stale.
+    def __init__(self, storage_dir: str = COLD_STORAGE_DIR, max_segment_bytes: int = 64 * 1024 * 1024,
+                 compaction_threshold: int = 4, compaction_dead_ratio: float = 0.5, sync: bool = False,
+                 bloom_capacity: int = DEFAULT_BLOOM_CAPACITY,
+                 bloom_false_positive_rate: float = DEFAULT_BLOOM_FALSE_POSITIVE_RATE,
+                 tombstone_grace: float = 3600.0):
         self.storage_dir = storage_dir
+        self.max_segment_bytes = max_segment_bytes
+        self.compaction_threshold = compaction_threshold # Immutable segments before a merge starts, 0 disables it
+        # Share of the immutable bytes that must be overwritten or deleted records before a merge
+        # starts; merging live data alone would rewrite everything without reclaiming anything
+        self.compaction_dead_ratio = compaction_dead_ratio
+        self.sync = sync # fsync after every write
+        self.tombstone_grace = tombstone_grace # Seconds a delete is remembered before compaction may drop it
         os.makedirs(self.storage_dir, exist_ok=True)
 
-    def _get_filepath(self, key: str) -> str:
-        return os.path.join(self.storage_dir, f"{key}.bin")
+        self._lock = threading.RLock()
+        self._compaction_lock = threading.Lock()
+        self._keydir: Dict[str, KeyDirEntry] = {}
+        self._read_fds: Dict[int, int] = {}
+        self._segment_sizes: Dict[int, int] = {} # Immutable segments only
+        self._dead_bytes: Dict[int, int] = {} # Per segment, bytes of records no longer in the keydir
+        self._active_id = 0
+        self._active_fd = -1
+        self._active_size = 0
+        self._active_entries: List[SegmentEntry] = []
+        self._last_timestamp = 0
+        self._compacting = False
+        self._compaction_thread: threading.Thread | None = None
+        self._closed = False
+        self.compactions = 0
+
+        self.bloom_capacity = bloom_capacity # Initial size, the filter doubles when it fills up
+        self.bloom_false_positive_rate = bloom_false_positive_rate
+        self._bloom: BloomFilter | None = None
+        self._bloom_pending: List[str] | None = None # Keys added while a rebuild is running
+        self._log_end = (0, 0) # (last segment id, its size) when the store was opened
+        self.bloom_checks = 0
+        self.bloom_negatives = 0
+        self.bloom_false_positives = 0
+
+        self._load()
+        self._load_bloom()
+        self._import_legacy_files()
+
+    def _segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.storage_dir, f"{segment_id:08d}{DATA_SUFFIX}")
+
+    def _hint_path(self, segment_id: int) -> str:
+        return os.path.join(self.storage_dir, f"{segment_id:08d}{HINT_SUFFIX}")
 
     def put(self, key: str, value_data_pb2: ValueData):
-        filepath = self._get_filepath(key)
-        kv_message = KeyValue(key=key, value=value_data_pb2)
-        with open(filepath, "wb") as f:
-            f.write(kv_message.SerializeToString())
+        self._append(key, value_data_pb2)
 
     def get(self, key: str) -> ValueData | None:
-        filepath = self._get_filepath(key)
-        if not os.path.exists(filepath):
-            return None
+        with self._lock:
+            entry = self._keydir.get(key)
+            if entry is None or entry.tombstone:
+                return None
+            record = os.pread(self._read_fds[entry.segment_id], entry.length, entry.offset)
         try:
-            with open(filepath, "rb") as f:
-                kv_message = KeyValue()
-                kv_message.ParseFromString(f.read())
-                return kv_message.value
+            kv_message, _, _ = decode_record(record)
+            return kv_message.value
         except Exception as e:
-            print(f"Error reading cold storage for {key}: {e}")
+            logger.warning("Error reading cold storage for %s: %s", key, e)
             return None
 
     def delete(self, key: str):
-        filepath = self._get_filepath(key)
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        with self._lock:
+            if not self._is_live(key):
+                return False
+            self._append(key, None, tombstone=True)
             return True
-        return False
\ No newline at end of file
+
+    def put_many(self, items: Dict[str, ValueData]):
+        # One write (and at most one fsync) for the whole batch
+        self._append_many([(key, value_data_pb2, False, None) for key, value_data_pb2 in items.items()])
+
+    def get_many(self, keys: List[str]) -> Dict[str, ValueData | None]:
+        return {key: value for key, (value, _) in self.get_many_versioned(keys).items()}
+
+    def get_many_versioned(self, keys: List[str]) -> Dict[str, Tuple[ValueData | None, int]]:
+        # key -> (value, timestamp of the record it came from); deleted keys are (None, time of
+        # the delete), keys never seen are (None, 0)
+        values: Dict[str, Tuple[ValueData | None, int]] = {key: (None, 0) for key in keys}
+        with self._lock:
+            timestamps = {}
+            records = {}
+            for key in keys:
+                entry = self._keydir.get(key)
+                if entry is None:
+                    continue
+                if entry.tombstone:
+                    values[key] = (None, entry.timestamp)
+                else:
+                    records[key] = os.pread(self._read_fds[entry.segment_id], entry.length, entry.offset)
+                    timestamps[key] = entry.timestamp
+        for key, record in records.items():
+            try:
+                kv_message, _, _ = decode_record(record)
+                values[key] = (kv_message.value, timestamps[key])
+            except Exception as e:
+                logger.warning("Error reading cold storage for %s: %s", key, e)
+        return values
+
+    def delete_many(self, keys: List[str]) -> Dict[str, bool]:
+        with self._lock:
+            deleted = {key: self._is_live(key) for key in keys}
+            self._append_many([(key, None, True, None) for key, present in deleted.items() if present])
+            return deleted
+
+    def apply_many(self, writes: Dict[str, Tuple[ValueData | None, int]]) -> Dict[str, bool]:
+        # Replicated writes: key -> (value, timestamp), None deletes. The caller's timestamp
+        # is stored as-is and a write older than the record or tombstone already held is
+        # skipped (last writer wins). Returns whether each key was present before.
+        with self._lock:
+            present = {}
+            records = []
+            for key, (value_data_pb2, timestamp) in writes.items():
+                entry = self._keydir.get(key)
+                present[key] = entry is not None and not entry.tombstone
+                if entry is not None and entry.timestamp > timestamp:
+                    continue
+                if value_data_pb2 is not None:
+                    records.append((key, value_data_pb2, False, timestamp))
+                elif present[key]:
+                    records.append((key, None, True, timestamp))
+            self._append_many(records)
+            return present
+
+    def might_contain(self, key: str) -> bool:
+        # False means the key is definitely not stored here. Only worth it where a negative saves
+        # more than a keydir lookup, e.g. a thread hop; the filter also holds deleted keys.
+        self.bloom_checks += 1
+        if self._bloom is None:
+            return True
+        if self._bloom.might_contain(key):
+            if key not in self._keydir:
+                self.bloom_false_positives += 1
+            return True
+        self.bloom_negatives += 1
+        return False
+
+    def bloom_stats(self) -> Dict[str, int]:
+        bloom = self._bloom
+        return {
+            "checks": self.bloom_checks,
+            "negatives": self.bloom_negatives,
+            "false_positives": self.bloom_false_positives,
+            "keys": bloom.count if bloom else 0,
+            "capacity": bloom.capacity if bloom else 0,
+        }
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return [key for key, entry in self._keydir.items() if not entry.tombstone]
+
+    def _is_live(self, key: str) -> bool:
+        entry = self._keydir.get(key)
+        return entry is not None and not entry.tombstone
+
+    def _append(self, key: str, value_data_pb2: ValueData | None, tombstone: bool = False):
+        self._append_many([(key, value_data_pb2, tombstone, None)])
+
+    def _append_many(self, writes: List[Tuple[str, ValueData | None, bool, int | None]]):
+        if not writes:
+            return
+        with self._lock:
+            records = []
+            entries: List[SegmentEntry] = []
+            offset = self._active_size
+            for key, value_data_pb2, tombstone, timestamp in writes:
+                if timestamp is None:
+                    timestamp = self._next_timestamp()
+                else:
+                    self._last_timestamp = max(self._last_timestamp, timestamp)
+                record = encode_record(key, value_data_pb2, timestamp, tombstone)
+                records.append(record)
+                entries.append((key, timestamp, FLAG_TOMBSTONE if tombstone else 0, offset, len(record)))
+                offset += len(record)
+            self._write_all(self._active_fd, b"".join(records))
+            if self.sync:
+                os.fsync(self._active_fd)
+            self._active_size = offset
+            self._active_entries.extend(entries)
+            for key, timestamp, flags, record_offset, length in entries:
+                self._apply(key, self._active_id, record_offset, length, timestamp, flags)
+            if self._active_size >= self.max_segment_bytes:
+                self._rotate()
+
+    def _next_timestamp(self) -> int:
+        # Wall clock in ns, forced to be strictly increasing within this store
+        self._last_timestamp = max(time.time_ns(), self._last_timestamp + 1)
+        return self._last_timestamp
+
+    def _apply(self, key: str, segment_id: int, offset: int, length: int, timestamp: int, flags: int):
+        previous = self._keydir.get(key)
+        if previous is not None:
+            self._dead_bytes[previous.segment_id] = self._dead_bytes.get(previous.segment_id, 0) + previous.length
+        if previous is None and self._bloom is not None:
+            self._bloom.add(key)
+            if self._bloom_pending is not None:
+                self._bloom_pending.append(key)
+            elif self._bloom.count > self._bloom.capacity:
+                self._start_bloom_rebuild() # Full: the false-positive rate would start to climb
+        self._keydir[key] = KeyDirEntry(segment_id, offset, length, timestamp, bool(flags & FLAG_TOMBSTONE))
+
+    @staticmethod
+    def _write_all(fd: int, data: bytes):
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+
+    # --- Segment lifecycle ---
+
+    def _load(self):
+        segment_ids = sorted(
+            int(name[:-len(DATA_SUFFIX)]) for name in os.listdir(self.storage_dir)
+            if name.endswith(DATA_SUFFIX) and name[:-len(DATA_SUFFIX)].isdigit()
+        )
+        entries: List[SegmentEntry] = []
+        valid_end = -1
+        for segment_id in segment_ids:
+            self._read_fds[segment_id] = os.open(self._segment_path(segment_id), os.O_RDONLY)
+            self._segment_sizes[segment_id] = os.path.getsize(self._segment_path(segment_id))
+            entries, valid_end = self._segment_entries(segment_id)
+            for key, timestamp, flags, offset, length in entries:
+                self._apply(key, segment_id, offset, length, timestamp, flags)
+                self._last_timestamp = max(self._last_timestamp, timestamp)
+
+        if segment_ids:
+            self._log_end = (segment_ids[-1], os.path.getsize(self._segment_path(segment_ids[-1])))
+        if segment_ids and valid_end >= 0:
+            # The last segment has no hint, so it was still active when the store was
+            # closed (or crashed): keep appending to it, cutting off any torn record.
+            self._open_active(segment_ids[-1], valid_end, entries)
+        else:
+            self._open_active(segment_ids[-1] + 1 if segment_ids else 0, 0, [])
+
+    def _open_active(self, segment_id: int, size: int, entries: List[SegmentEntry]):
+        path = self._segment_path(segment_id)
+        self._active_fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        if os.fstat(self._active_fd).st_size != size:
+            os.ftruncate(self._active_fd, size)
+        if segment_id not in self._read_fds:
+            self._read_fds[segment_id] = os.open(path, os.O_RDONLY)
+        self._segment_sizes.pop(segment_id, None)
+        self._active_id = segment_id
+        self._active_size = size
+        self._active_entries = entries
+
+    def _rotate(self):
+        # Seal the active segment with a hint file and start a new one
+        self._write_hint(self._active_id, self._active_entries)
+        os.close(self._active_fd)
+        self._segment_sizes[self._active_id] = self._active_size
+        self._open_active(self._active_id + 1, 0, [])
+
+        if self.compaction_threshold and not self._compacting and self._needs_compaction():
+            self._compacting = True
+            self._compaction_thread = threading.Thread(
+                target=self._run_compaction, name=f"compaction-{self.storage_dir}", daemon=True
+            )
+            self._compaction_thread.start()
+
+    def _needs_compaction(self) -> bool:
+        immutable_ids = [segment_id for segment_id in self._read_fds if segment_id != self._active_id]
+        if len(immutable_ids) < self.compaction_threshold:
+            return False
+        total = sum(self._segment_sizes.get(segment_id, 0) for segment_id in immutable_ids)
+        dead = sum(self._dead_bytes.get(segment_id, 0) for segment_id in immutable_ids)
+        return total > 0 and dead >= total * self.compaction_dead_ratio
+
+    def _segment_entries(self, segment_id: int) -> Tuple[List[SegmentEntry], int]:
+        hint_path = self._hint_path(segment_id)
+        if os.path.exists(hint_path):
+            try:
+                return self._read_hint(hint_path), -1
+            except (struct.error, UnicodeDecodeError, ValueError) as e:
+                logger.warning("Ignoring unreadable hint file %s: %s", hint_path, e)
+        return self._scan_segment(segment_id)
+
+    def _scan_segment(self, segment_id: int) -> Tuple[List[SegmentEntry], int]:
+        # Returns the records of a segment and the offset where the valid data ends
+        entries: List[SegmentEntry] = []
+        offset = 0
+        with open(self._segment_path(segment_id), "rb") as f:
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                _, _, _, length = decode_header(header)
+                record = header + f.read(length)
+                try:
+                    kv_message, timestamp, flags = decode_record(record)
+                except CorruptRecordError:
+                    break # Torn write at the tail of the segment
+                entries.append((kv_message.key, timestamp, flags, offset, len(record)))
+                offset += len(record)
+        return entries, offset
+
+    def _write_hint(self, segment_id: int, entries: List[SegmentEntry]):
+        hint_path = self._hint_path(segment_id)
+        tmp_path = hint_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HINT_MAGIC)
+            for key, timestamp, flags, offset, length in entries:
+                key_bytes = key.encode("utf-8")
+                f.write(HINT_ENTRY.pack(timestamp, flags, offset, length, len(key_bytes)))
+                f.write(key_bytes)
+            if self.sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, hint_path)
+
+    @staticmethod
+    def _read_hint(hint_path: str) -> List[SegmentEntry]:
+        entries: List[SegmentEntry] = []
+        with open(hint_path, "rb") as f:
+            data = f.read()
+        if not data.startswith(HINT_MAGIC):
+            raise ValueError("unknown hint file format")
+        position = len(HINT_MAGIC)
+        while position < len(data):
+            timestamp, flags, offset, length, key_length = HINT_ENTRY.unpack_from(data, position)
+            position += HINT_ENTRY.size
+            if position + key_length > len(data):
+                raise ValueError("truncated hint entry")
+            key = data[position:position + key_length].decode("utf-8")
+            position += key_length
+            entries.append((key, timestamp, flags, offset, length))
+        return entries
+
+    # --- Bloom filter ---
+
+    def _load_bloom(self):
+        # Reuse the saved filter only if nothing was written after it was saved
+        path = os.path.join(self.storage_dir, BLOOM_FILENAME)
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    bloom, marker = BloomFilter.from_bytes(f.read())
+                if marker == self._log_end and bloom.false_positive_rate == self.bloom_false_positive_rate:
+                    self._bloom = bloom
+                    return
+            except (ValueError, struct.error) as e:
+                logger.warning("Ignoring unreadable bloom filter %s: %s", path, e)
+        self._rebuild_bloom()
+
+    def _start_bloom_rebuild(self):
+        self._bloom_pending = []
+        threading.Thread(target=self._rebuild_bloom, kwargs={"started": True},
+                         name=f"bloom-{self.storage_dir}", daemon=True).start()
+
+    def _rebuild_bloom(self, started: bool = False):
+        # Build a fresh filter from the keydir: sized for twice the live keys and without
+        # the deleted ones. Keys written meanwhile are collected in _bloom_pending.
+        with self._lock:
+            if not started:
+                if self._bloom_pending is not None:
+                    return # Another rebuild is already running
+                self._bloom_pending = []
+            keys = list(self._keydir)
+        bloom = BloomFilter(max(self.bloom_capacity, 2 * len(keys)), self.bloom_false_positive_rate)
+        for key in keys:
+            bloom.add(key)
+        with self._lock:
+            for key in self._bloom_pending:
+                bloom.add(key)
+            self._bloom_pending = None
+            self._bloom = bloom
+
+    def _save_bloom(self):
+        if self._bloom is None or self._bloom_pending is not None:
+            return # Nothing usable to save, the next start rebuilds it
+        path = os.path.join(self.storage_dir, BLOOM_FILENAME)
+        with open(path + ".tmp", "wb") as f:
+            f.write(self._bloom.to_bytes(marker=(self._active_id, self._active_size)))
+        os.replace(path + ".tmp", path)
+
+    def _import_legacy_files(self):
+        # Fold per-key {key}.bin files written by the old layout into the log
+        for name in sorted(os.listdir(self.storage_dir)):
+            if not name.endswith(LEGACY_SUFFIX):
+                continue
+            filepath = os.path.join(self.storage_dir, name)
+            try:
+                with open(filepath, "rb") as f:
+                    kv_message = KeyValue()
+                    kv_message.ParseFromString(f.read())
+            except Exception as e:
+                logger.warning("Error importing legacy cold storage file %s: %s", filepath, e)
+                continue
+            if kv_message.key not in self._keydir:
+                self.put(kv_message.key, kv_message.value)
+            os.remove(filepath)
+
+    # --- Compaction ---
+
+    def _run_compaction(self):
+        try:
+            self.compact()
+        except Exception as e:
+            logger.error("Compaction of %s failed: %s", self.storage_dir, e)
+        finally:
+            self._compacting = False
+
+    def compact(self):
+        # Merge every immutable segment, keeping only the latest live record of each key.
+        # Merged output reuses the ids of the input segments, so the startup scan order
+        # (and therefore which record wins) stays the same even after a crash mid-merge.
+        with self._compaction_lock:
+            with self._lock:
+                if self._closed:
+                    return
+                input_ids = sorted(segment_id for segment_id in self._read_fds if segment_id != self._active_id)
+                input_fds = {segment_id: self._read_fds[segment_id] for segment_id in input_ids}
+            if not input_ids:
+                return
+
+            # Inputs are immutable, so copying needs no lock; liveness is checked again on swap
+            outputs: List[Tuple[str, List[SegmentEntry]]] = []
+            moved: List[Tuple[str, int, int, int, int, int, int, int]] = []
+            expired: List[Tuple[str, int, int]] = [] # Tombstones old enough to forget
+            expire_before = time.time_ns() - int(self.tombstone_grace * 1e9)
+            output_sizes: List[int] = []
+            out_fd = -1
+            out_size = 0
+            try:
+                for segment_id in input_ids:
+                    entries, _ = self._segment_entries(segment_id)
+                    for key, timestamp, flags, offset, length in entries:
+                        with self._lock:
+                            entry = self._keydir.get(key)
+                        if entry is None or entry.segment_id != segment_id or entry.offset != offset:
+                            continue
+                        if flags & FLAG_TOMBSTONE and timestamp < expire_before:
+                            # Every older record of the key is in this merge too, so it can go
+                            expired.append((key, segment_id, offset))
+                            continue
+                        record = os.pread(input_fds[segment_id], length, offset)
+                        if out_fd < 0 or (out_size >= self.max_segment_bytes and len(outputs) < len(input_ids)):
+                            if out_fd >= 0:
+                                self._close_output(out_fd)
+                            tmp_path = self._segment_path(input_ids[len(outputs)]) + ".merge"
+                            out_fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                            outputs.append((tmp_path, []))
+                            output_sizes.append(0)
+                            out_size = 0
+                        self._write_all(out_fd, record)
+                        outputs[-1][1].append((key, timestamp, flags, out_size, length))
+                        moved.append((key, segment_id, offset, len(outputs) - 1, out_size, length, timestamp, flags))
+                        out_size += length
+                        output_sizes[-1] = out_size
+            finally:
+                if out_fd >= 0:
+                    self._close_output(out_fd)
+
+            with self._lock:
+                for index, (tmp_path, entries) in enumerate(outputs):
+                    segment_id = input_ids[index]
+                    if os.path.exists(self._hint_path(segment_id)):
+                        os.remove(self._hint_path(segment_id))
+                    os.replace(tmp_path, self._segment_path(segment_id))
+                    self._write_hint(segment_id, entries)
+                for segment_id in input_ids[len(outputs):]:
+                    os.remove(self._segment_path(segment_id))
+                    if os.path.exists(self._hint_path(segment_id)):
+                        os.remove(self._hint_path(segment_id))
+
+                for segment_id in input_ids:
+                    os.close(self._read_fds.pop(segment_id))
+                for index in range(len(outputs)):
+                    segment_id = input_ids[index]
+                    self._read_fds[segment_id] = os.open(self._segment_path(segment_id), os.O_RDONLY)
+
+                for segment_id in input_ids:
+                    self._segment_sizes.pop(segment_id, None)
+                    self._dead_bytes.pop(segment_id, None)
+                for index, size in enumerate(output_sizes):
+                    self._segment_sizes[input_ids[index]] = size
+                for key, old_segment, old_offset, index, offset, length, timestamp, flags in moved:
+                    entry = self._keydir.get(key)
+                    if entry is not None and entry.segment_id == old_segment and entry.offset == old_offset:
+                        self._keydir[key] = KeyDirEntry(input_ids[index], offset, length, timestamp,
+                                                        bool(flags & FLAG_TOMBSTONE))
+                    else: # Overwritten or deleted while the merge ran
+                        self._dead_bytes[input_ids[index]] = self._dead_bytes.get(input_ids[index], 0) + length
+                for key, old_segment, old_offset in expired:
+                    entry = self._keydir.get(key)
+                    if entry is not None and entry.segment_id == old_segment and entry.offset == old_offset:
+                        del self._keydir[key]
+                self.compactions += 1
+
+            self._rebuild_bloom() # Drop the keys whose tombstones were just merged away
+
+    def _close_output(self, fd: int):
+        if self.sync:
+            os.fsync(fd)
+        os.close(fd)
+
+    def close(self):
+        compaction_thread = self._compaction_thread
+        if compaction_thread is not None:
+            compaction_thread.join()
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            # The hint and the filter only speed up the next start, a failure there
+            # must not leave the files open
+            try:
+                if self._active_size > 0:
+                    self._write_hint(self._active_id, self._active_entries)
+                self._save_bloom()
+            finally:
+                if self.sync:
+                    os.fsync(self._active_fd)
+                os.close(self._active_fd)
+                for fd in self._read_fds.values():
+                    os.close(fd)
+                self._read_fds.clear()
@@ -0,0 +1,42 @@
+import struct
+import zlib
+from typing import Tuple
+from .encoding_pb2 import KeyValue, ValueData #type:ignore
+
+# On-disk record layout used by the segment log:
+#   crc32 (4) | timestamp ns (8) | flags (1) | payload length (4) | payload
+# The payload is a serialized KeyValue message. The crc covers everything
+# after the crc field itself.
+RECORD_HEADER = struct.Struct(">IQBI")
+FLAG_TOMBSTONE = 0x01
+
+
+class CorruptRecordError(Exception):
+    pass
+
+
+def encode_record(key: str, value_data_pb2: ValueData | None, timestamp: int, tombstone: bool = False) -> bytes:
+    kv_message = KeyValue(key=key)
+    if value_data_pb2 is not None and not tombstone:
+        kv_message.value.CopyFrom(value_data_pb2)
+    payload = kv_message.SerializeToString()
+    flags = FLAG_TOMBSTONE if tombstone else 0
+    body = RECORD_HEADER.pack(0, timestamp, flags, len(payload))[4:] + payload
+    return struct.pack(">I", zlib.crc32(body)) + body
+
+
+def decode_header(header: bytes) -> Tuple[int, int, int, int]:
+    # Returns (crc, timestamp, flags, payload_length)
+    return RECORD_HEADER.unpack(header)
+
+
+def decode_record(record: bytes) -> Tuple[KeyValue, int, int]:
+    # Returns (KeyValue, timestamp, flags) for a full record, verifying its crc
+    if len(record) < RECORD_HEADER.size:
+        raise CorruptRecordError("truncated record header")
+    crc, timestamp, flags, length = decode_header(record[:RECORD_HEADER.size])
+    if len(record) != RECORD_HEADER.size + length or zlib.crc32(record[4:]) != crc:
+        raise CorruptRecordError("record checksum mismatch")
+    kv_message = KeyValue()
+    kv_message.ParseFromString(record[RECORD_HEADER.size:])
+    return kv_message, timestamp, flags
@@ -0,0 +1,111 @@
+from collections import OrderedDict
+
+
+class EvictionPolicy:
+    # Tracks key recency/frequency for HotStorage and picks which key to evict.
+    # HotStorage owns the data; a policy only ever sees keys.
+    def on_insert(self, key: str):
+        raise NotImplementedError
+
+    def on_access(self, key: str):
+        raise NotImplementedError
+
+    def on_remove(self, key: str):
+        raise NotImplementedError
+
+    def victim(self) -> str:
+        # Choose a resident key to evict and stop tracking it as resident
+        raise NotImplementedError
+
+
+class LRUPolicy(EvictionPolicy):
+    def __init__(self, capacity: int | None = None):
+        self._order: OrderedDict[str, None] = OrderedDict()
+
+    def on_insert(self, key: str):
+        self._order[key] = None
+
+    def on_access(self, key: str):
+        if key in self._order:
+            self._order.move_to_end(key)
+
+    def on_remove(self, key: str):
+        self._order.pop(key, None)
+
+    def victim(self) -> str:
+        key, _ = self._order.popitem(last=False)
+        return key
+
+
+class ARCPolicy(EvictionPolicy):
+    # Adaptive Replacement Cache (Megiddo & Modha). T1 holds keys seen once
+    # recently, T2 keys seen at least twice; B1/B2 are ghost lists of keys
+    # recently evicted from them. Hits in the ghost lists move the target size p
+    # of T1, so a one-off scan only churns T1 and leaves the frequent set in T2.
+    def __init__(self, capacity: int | None = None):
+        self.capacity = capacity # None: follow the number of resident keys
+        self.p = 0.0
+        self._t1: OrderedDict[str, None] = OrderedDict()
+        self._t2: OrderedDict[str, None] = OrderedDict()
+        self._b1: OrderedDict[str, None] = OrderedDict()
+        self._b2: OrderedDict[str, None] = OrderedDict()
+
+    def _capacity(self) -> int:
+        if self.capacity is not None:
+            return self.capacity
+        return max(len(self._t1) + len(self._t2), 1)
+
+    def on_insert(self, key: str):
+        capacity = self._capacity()
+        if key in self._b1:
+            self.p = min(float(capacity), self.p + max(len(self._b2) / len(self._b1), 1.0))
+            del self._b1[key]
+            self._t2[key] = None
+        elif key in self._b2:
+            self.p = max(0.0, self.p - max(len(self._b1) / len(self._b2), 1.0))
+            del self._b2[key]
+            self._t2[key] = None
+        else:
+            self._t1[key] = None
+        self._trim_ghosts()
+
+    def on_access(self, key: str):
+        if key in self._t1:
+            del self._t1[key]
+            self._t2[key] = None
+        elif key in self._t2:
+            self._t2.move_to_end(key)
+
+    def on_remove(self, key: str):
+        for keys in (self._t1, self._t2, self._b1, self._b2):
+            keys.pop(key, None)
+
+    def victim(self) -> str:
+        if self._t1 and (len(self._t1) > self.p or not self._t2):
+            key, _ = self._t1.popitem(last=False)
+            self._b1[key] = None
+        else:
+            key, _ = self._t2.popitem(last=False)
+            self._b2[key] = None
+        self._trim_ghosts()
+        return key
+
+    def _trim_ghosts(self):
+        capacity = self._capacity()
+        while self._b1 and len(self._t1) + len(self._b1) > capacity:
+            self._b1.popitem(last=False)
+        while self._b2 and len(self._b1) + len(self._b2) > capacity:
+            self._b2.popitem(last=False)
+
+
+EVICTION_POLICIES = {
+    "lru": LRUPolicy,
+    "arc": ARCPolicy,
+}
+
+
+def make_policy(name: str, capacity: int | None = None) -> EvictionPolicy:
+    try:
+        return EVICTION_POLICIES[name](capacity)
+    except KeyError:
+        raise ValueError(f"Unknown eviction policy '{name}', expected one of {sorted(EVICTION_POLICIES)}") from None
@@ -1,18 +1,192 @@
+import logging
+import threading
+from typing import Callable, Dict, List, Tuple
+from .eviction import make_policy
+
+DEFAULT_MAX_ENTRIES = 100_000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Rough per-entry cost of the dict slot, policy bookkeeping and protobuf object,
+# on top of the serialized key and value
+ENTRY_OVERHEAD_BYTES = 128
+
+logger = logging.getLogger(__name__)
+
+
 class HotStorage:
-    def __init__(self):
+    # In-memory tier bounded by entry count and approximate bytes. When a put
+    # goes over budget the eviction policy picks victims; entries put with
+    # dirty=True (not yet in cold storage) are handed to on_evict for demotion,
+    # together with the timestamp they were written with. If that fails they
+    # stay resident, over budget, until a flush or a later demotion succeeds.
+    def __init__(self, max_entries: int | None = DEFAULT_MAX_ENTRIES, max_bytes: int | None = DEFAULT_MAX_BYTES,
+                 policy: str = "lru", on_evict: Callable[[str, object, int], None] | None = None):
         self.store = {}
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = make_policy(policy, max_entries)
+        self.on_evict = on_evict
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sizes: Dict[str, int] = {}
+        self._dirty: Dict[str, int] = {} # Dirty key -> write timestamp
+        self._lock = threading.RLock()
+        # Fills (promotions from cold storage) in progress: a fill holds the write sequence number
+        # from when it missed, and skips every key written or removed after that, so a value read
+        # from cold never replaces a newer write that raced with the cold read
+        self._write_seq = 0
+        self._fills: Dict[int, int] = {} # Token -> fills holding it
+        self._written: Dict[str, int] = {} # Key -> sequence of its last write, kept while fills run
+
+    def put(self, key: str, value_data_pb2, dirty: bool = False, timestamp: int = 0):
+        self.put_many({key: value_data_pb2}, dirty, timestamp)
+
+    def put_many(self, items: Dict[str, object], dirty: bool = False, timestamp: int = 0):
+        with self._lock:
+            for key, value_data_pb2 in items.items():
+                self._record_write(key)
+                self._insert(key, value_data_pb2)
+                if dirty:
+                    self._dirty[key] = timestamp
+                else:
+                    self._dirty.pop(key, None)
+            self._evict_over_budget()
 
-    def put(self, key: str, value_data_pb2):
+    def _insert(self, key: str, value_data_pb2):
+        if key in self.store:
+            self.current_bytes -= self._sizes[key]
+            self.policy.on_access(key)
+        else:
+            self.policy.on_insert(key)
+        size = len(key) + value_data_pb2.ByteSize() + ENTRY_OVERHEAD_BYTES
         self.store[key] = value_data_pb2
+        self._sizes[key] = size
+        self.current_bytes += size
+
+    def _record_write(self, key: str):
+        self._write_seq += 1
+        if self._fills:
+            self._written[key] = self._write_seq
+
+    def lookup(self, keys: List[str]) -> Tuple[Dict[str, object], int | None]:
+        # get_many that, if any key missed, also starts a fill: the returned token must be
+        # passed to fill_many once the missing keys were read from cold storage
+        with self._lock:
+            found = {key: self.get(key) for key in keys}
+            if all(value is not None for value in found.values()):
+                return found, None
+            token = self._write_seq
+            self._fills[token] = self._fills.get(token, 0) + 1
+            return found, token
+
+    def fill_many(self, items: Dict[str, object], token: int):
+        # Inserts clean entries read from cold storage, except for keys that are resident or
+        # were written or removed since the lookup that returned token. Ends the fill, so it
+        # must be called (with no items if the cold read failed) for every token.
+        with self._lock:
+            for key, value_data_pb2 in items.items():
+                if key not in self.store and self._written.get(key, 0) <= token:
+                    self._insert(key, value_data_pb2)
+            self._fills[token] -= 1
+            if not self._fills[token]:
+                del self._fills[token]
+            if not self._fills:
+                self._written.clear()
+            elif len(self._written) > len(self.store) + 1024:
+                oldest = min(self._fills)
+                self._written = {key: seq for key, seq in self._written.items() if seq > oldest}
+            self._evict_over_budget()
+
+    def fence(self, keys: List[str]):
+        # Makes fills that are in progress skip these keys, e.g. once a delete reached cold storage
+        with self._lock:
+            for key in keys:
+                self._record_write(key)
 
     def get(self, key: str):
-        return self.store.get(key)
+        with self._lock:
+            value = self.store.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.policy.on_access(key)
+            return value
+
+    def get_many(self, keys: List[str]) -> Dict[str, object]:
+        with self._lock:
+            return {key: self.get(key) for key in keys}
 
     def remove(self, key: str):
-        if key in self.store:
-            del self.store[key]
-            return True
-        return False
+        with self._lock:
+            self._record_write(key)
+            if key in self.store:
+                self._drop(key)
+                self.policy.on_remove(key)
+                return True
+            return False
+
+    def remove_many(self, keys: List[str]) -> Dict[str, bool]:
+        with self._lock:
+            return {key: self.remove(key) for key in keys}
+
+    def dirty_items(self) -> Dict[str, Tuple[object, int]]:
+        # key -> (value, write timestamp) for every entry not in cold storage yet
+        with self._lock:
+            return {key: (self.store[key], timestamp) for key, timestamp in self._dirty.items()}
+
+    def mark_clean(self, timestamps: Dict[str, int]):
+        # Clears the dirty flag of entries that were flushed, unless they were rewritten since
+        with self._lock:
+            for key, timestamp in timestamps.items():
+                if self._dirty.get(key) == timestamp:
+                    del self._dirty[key]
 
     def get_all_keys(self):
-        return list(self.store.keys())
\ No newline at end of file
+        with self._lock:
+            return list(self.store.keys())
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self.store),
+                "bytes": self.current_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "dirty": len(self._dirty),
+            }
+
+    def _over_budget(self) -> bool:
+        if self.max_entries is not None and len(self.store) > self.max_entries:
+            return True
+        return self.max_bytes is not None and self.current_bytes > self.max_bytes
+
+    def _evict_over_budget(self):
+        held = [] # Dirty victims kept because demotion failed
+        while len(self.store) > len(held) and self._over_budget():
+            key = self.policy.victim()
+            timestamp = self._dirty.get(key)
+            if timestamp is not None and self.on_evict is not None:
+                if held:
+                    held.append(key) # Demotions are failing, don't retry each one
+                    continue
+                try:
+                    # Demote while still holding the lock so a concurrent get never
+                    # sees the key missing from both tiers
+                    self.on_evict(key, self.store[key], timestamp)
+                except Exception as e:
+                    logger.warning("Demotion of '%s' failed, keeping it in hot storage: %s", key, e)
+                    held.append(key)
+                    continue
+            self._drop(key)
+            self.evictions += 1
+        for key in held:
+            self.policy.on_remove(key) # Drop the ghost entry ARC made for it
+            self.policy.on_insert(key)
+
+    def _drop(self, key: str):
+        self.current_bytes -= self._sizes.pop(key)
+        self._dirty.pop(key, None)
+        return self.store.pop(key)
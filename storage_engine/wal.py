@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Tuple
+from .encoding_pb2 import ValueData #type:ignore
+from .encoding import RECORD_HEADER, FLAG_TOMBSTONE, CorruptRecordError, decode_header, decode_record, encode_record
+
+WAL_SUFFIX = ".wal"
+
+
+class WriteAheadLog:
+    # Append-only log of acknowledged writes that are not in cold storage yet.
+    # Writers hand their records to a committer thread and block until they are
+    # on disk; everything that arrives while the previous fsync (plus the commit
+    # window) is in progress is written and fsynced together (group commit).
+    # The log is split into generations: rotate() seals the current file, and
+    # truncate() drops sealed generations once their writes reached cold storage.
+    def __init__(self, wal_dir: str, commit_window: float = 0.001, sync: bool = True):
+        self.wal_dir = wal_dir
+        self.commit_window = commit_window # Seconds the committer waits for more writers to join a batch
+        self.sync = sync
+        os.makedirs(self.wal_dir, exist_ok=True)
+
+        self._condition = threading.Condition()
+        self._pending: List[bytes] = []
+        self._appended = 0 # Last ticket handed to a writer
+        self._durable = 0 # Last ticket known to be on disk
+        self._error: Exception | None = None
+        self._closed = False
+        self._io_lock = threading.Lock() # Held while writing to or swapping the current file
+        self.commits = 0
+
+        generations = self._generations()
+        self._generation = generations[-1] + 1 if generations else 0
+        self._fd = self._open_generation(self._generation)
+        self._committer = threading.Thread(target=self._commit_loop, name=f"wal-{wal_dir}", daemon=True)
+        self._committer.start()
+
+    def _path(self, generation: int) -> str:
+        return os.path.join(self.wal_dir, f"{generation:08d}{WAL_SUFFIX}")
+
+    def _generations(self) -> List[int]:
+        return sorted(
+            int(name[:-len(WAL_SUFFIX)]) for name in os.listdir(self.wal_dir)
+            if name.endswith(WAL_SUFFIX) and name[:-len(WAL_SUFFIX)].isdigit()
+        )
+
+    def _open_generation(self, generation: int) -> int:
+        return os.open(self._path(generation), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def append(self, writes: Dict[str, Tuple[ValueData | None, int]]):
+        # key -> (value, timestamp), None logs a delete. Returns once the records are durable.
+        data = b"".join(
+            encode_record(key, value_data_pb2, timestamp, tombstone=value_data_pb2 is None)
+            for key, (value_data_pb2, timestamp) in writes.items()
+        )
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f"Write-ahead log {self.wal_dir} is closed")
+            self._pending.append(data)
+            self._appended += 1
+            ticket = self._appended
+            self._condition.notify_all()
+            while self._durable < ticket and self._error is None:
+                self._condition.wait()
+            if self._durable < ticket:
+                raise self._error
+
+    def _commit_loop(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+            if self.commit_window:
+                time.sleep(self.commit_window) # Let concurrent writers join this fsync
+            with self._io_lock:
+                with self._condition:
+                    batch = b"".join(self._pending)
+                    self._pending = []
+                    ticket = self._appended
+                try:
+                    view = memoryview(batch)
+                    while view:
+                        view = view[os.write(self._fd, view):]
+                    if self.sync:
+                        os.fsync(self._fd)
+                except Exception as e:
+                    with self._condition:
+                        self._error = e
+                        self._condition.notify_all()
+                    return
+            with self._condition:
+                self._durable = ticket
+                self.commits += 1
+                self._condition.notify_all()
+
+    def replay(self) -> Iterator[Tuple[str, ValueData | None, int]]:
+        # Yields (key, value or None for a delete, timestamp) from every sealed or
+        # leftover generation, oldest first, stopping at a torn record in each file
+        for generation in self._generations():
+            if generation == self._generation:
+                continue
+            with open(self._path(generation), "rb") as f:
+                while True:
+                    header = f.read(RECORD_HEADER.size)
+                    if len(header) < RECORD_HEADER.size:
+                        break
+                    _, _, _, length = decode_header(header)
+                    try:
+                        kv_message, timestamp, flags = decode_record(header + f.read(length))
+                    except CorruptRecordError:
+                        break
+                    value_data_pb2 = None if flags & FLAG_TOMBSTONE else kv_message.value
+                    yield kv_message.key, value_data_pb2, timestamp
+
+    def rotate(self) -> int:
+        # Starts a new generation and returns the id of the one just sealed. Writes
+        # that are acknowledged after this call are never in the sealed generations.
+        with self._io_lock:
+            sealed = self._generation
+            if self.sync:
+                os.fsync(self._fd)
+            os.close(self._fd)
+            self._generation += 1
+            self._fd = self._open_generation(self._generation)
+            return sealed
+
+    def truncate(self, through_generation: int):
+        # Drops sealed generations whose writes are all in cold storage now
+        for generation in self._generations():
+            if generation <= through_generation and generation != self._generation:
+                os.remove(self._path(generation))
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._committer.join()
+        with self._io_lock:
+            os.close(self._fd)
@@ -0,0 +1,173 @@
+import os
+import pytest
+from ..api import KeyValueStore
+from ..partitioning.ring_state import RING_FILENAME
+
+
+def test_layout_survives_reopen(tmp_path):
+    store = KeyValueStore(num_shards=3, cold_dir=str(tmp_path))
+    store.put_many({f"k{i}": str(i) for i in range(200)})
+    store.remove_shard(0)
+    store.add_shard()
+    store.shutdown()
+
+    # Reopened without a layout: the saved ring routes every key to the shard holding it
+    reopened = KeyValueStore(cold_dir=str(tmp_path))
+    assert reopened.get_many([f"k{i}" for i in range(200)]).values == {f"k{i}": str(i) for i in range(200)}
+    reopened.shutdown()
+
+
+def test_conflicting_layout_is_refused(tmp_path):
+    KeyValueStore(num_shards=2, cold_dir=str(tmp_path)).shutdown()
+    with pytest.raises(ValueError):
+        KeyValueStore(num_shards=4, cold_dir=str(tmp_path))
+
+
+def test_keys_written_under_another_layout_are_rehomed(tmp_path):
+    # A directory without a saved ring, e.g. from before layouts were saved
+    store = KeyValueStore(num_shards=4, cold_dir=str(tmp_path))
+    store.put_many({f"k{i}": str(i) for i in range(100)})
+    store.shutdown()
+    os.remove(os.path.join(tmp_path, RING_FILENAME))
+
+    rehomed = KeyValueStore(num_shards=2, cold_dir=str(tmp_path))
+    assert rehomed.get_many([f"k{i}" for i in range(100)]).values == {f"k{i}": str(i) for i in range(100)}
+    rehomed.shutdown()
+
+
+def _failing_after(moves: int, move_key):
+    calls = []
+
+    def move(*args):
+        calls.append(args)
+        if len(calls) > moves:
+            raise OSError("target shard down")
+        move_key(*args)
+    return move
+
+
+def test_interrupted_add_shard_is_resumed(tmp_path):
+    store = KeyValueStore(num_shards=2, cold_dir=str(tmp_path))
+    items = {f"k{i}": str(i) for i in range(200)}
+    store.put_many(items)
+    move_key = store._move_key
+    store._move_key = _failing_after(5, move_key)
+    with pytest.raises(OSError):
+        store.add_shard()
+    # Both rings stay in use: keys that did not move are still found, new writes land
+    assert store._previous_sharder is not None
+    assert store.get_many(list(items)).values == items
+    store.put("k0", "new")
+
+    store._move_key = move_key
+    assert store.add_shard() == 3 # Finishes the move to shard 2 first
+    assert store._previous_sharder is None
+    assert store.get_many(list(items)).values == {**items, "k0": "new"}
+    store.shutdown()
+
+
+def test_interrupted_remove_shard_is_resumed(tmp_path):
+    store = KeyValueStore(num_shards=3, cold_dir=str(tmp_path))
+    items = {f"k{i}": str(i) for i in range(200)}
+    store.put_many(items)
+    move_key = store._move_key
+    store._move_key = _failing_after(5, move_key)
+    with pytest.raises(OSError):
+        store.remove_shard(0)
+    assert 0 in store.shards
+
+    store._move_key = move_key
+    store.resume_resharding()
+    assert sorted(store.shards) == [1, 2]
+    assert not any(name.startswith("shard_0_") for name in os.listdir(tmp_path))
+    assert store.get_many(list(items)).values == items
+    store.shutdown()
+
+    reopened = KeyValueStore(cold_dir=str(tmp_path))
+    assert sorted(reopened.shards) == [1, 2]
+    assert reopened.get_many(list(items)).values == items
+    reopened.shutdown()
+
+
+def _record_batches(store: KeyValueStore, method: str) -> dict:
+    calls = {}
+    for shard_id, shard in store.shards.items():
+        batch_op = getattr(shard, method)
+
+        def record(keys, shard_id=shard_id, batch_op=batch_op):
+            calls.setdefault(shard_id, []).append(sorted(keys))
+            return batch_op(keys)
+        setattr(shard, method, record)
+    return calls
+
+
+def test_batches_go_down_once_per_shard(tmp_path):
+    store = KeyValueStore(num_shards=3, cold_dir=str(tmp_path))
+    items = {f"k{i}": str(i) for i in range(60)}
+    by_shard = {}
+    for key in items:
+        by_shard.setdefault(store.sharder.get_shard_id(key), []).append(key)
+    expected = {shard_id: [sorted(keys)] for shard_id, keys in by_shard.items()}
+
+    puts = _record_batches(store, "put_many")
+    assert store.put_many(items).values == dict.fromkeys(items, True)
+    assert puts == expected
+    gets = _record_batches(store, "get_many")
+    assert store.get_many(list(items)).values == items
+    assert gets == expected
+    deletes = _record_batches(store, "delete_many")
+    assert store.delete_many(list(items)).values == dict.fromkeys(items, True)
+    assert deletes == expected
+    store.shutdown()
+
+
+def test_duplicate_keys_are_handled_once(tmp_path):
+    store = KeyValueStore(num_shards=2, cold_dir=str(tmp_path))
+    store.put_many({"a": "1", "b": "2"})
+    assert store.get_many(["a", "b", "a", "missing", "a"]).values == {"a": "1", "b": "2", "missing": None}
+    result = store.delete_many(["a", "a", "missing"])
+    assert result.values == {"a": True, "missing": False}
+    assert result.errors == {}
+    store.shutdown()
+
+
+def test_failing_shard_batch_only_fails_its_own_keys(tmp_path):
+    store = KeyValueStore(num_shards=3, cold_dir=str(tmp_path))
+    items = {f"k{i}": str(i) for i in range(60)}
+    store.put_many(items)
+    error = OSError("shard down")
+
+    def fail(keys):
+        raise error
+    store.shards[1].get_many = fail
+
+    result = store.get_many(list(items))
+    failed = {key for key in items if store.sharder.get_shard_id(key) == 1}
+    assert result.errors == dict.fromkeys(failed, error)
+    assert result.values == {key: value for key, value in items.items() if key not in failed}
+    store.shutdown()
+
+
+def test_batches_go_per_key_while_resharding(tmp_path):
+    store = KeyValueStore(num_shards=2, cold_dir=str(tmp_path))
+    items = {f"k{i}": str(i) for i in range(100)}
+    store.put_many(items)
+    move_key = store._move_key
+    store._move_key = _failing_after(0, move_key) # Leaves every key on its old shard
+    with pytest.raises(OSError):
+        store.add_shard()
+    moving = [key for key in items if store.sharder.get_shard_id(key) == 2]
+    assert moving
+    batches = [_record_batches(store, method) for method in ("put_many", "get_many")]
+
+    # Keys still on their old shard are found there, deleted there, and rewritten on the new owner
+    assert store.get_many(list(items)).values == items
+    assert store.delete_many(moving[:5]).values == dict.fromkeys(moving[:5], True)
+    assert store.put_many({key: "new" for key in moving[5:10]}).errors == {}
+    assert batches == [{}, {}]
+
+    store._move_key = move_key
+    store.resume_resharding()
+    expected = {**items, **dict.fromkeys(moving[:5]), **dict.fromkeys(moving[5:10], "new")}
+    assert store.get_many(list(items)).values == expected
+    store.shutdown()
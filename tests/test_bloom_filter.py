@@ -0,0 +1,102 @@
+import os
+import time
+from ..replication.replication_manager import ReplicationManager
+from ..storage_engine.cold_storage import ColdStorage, BLOOM_FILENAME
+from ..storage_engine.encoding_pb2 import ValueData #type:ignore
+
+
+def _count_rebuilds(monkeypatch) -> list:
+    rebuilds = []
+    rebuild = ColdStorage._rebuild_bloom
+
+    def counting(self, *args, **kwargs):
+        rebuilds.append(self.storage_dir)
+        rebuild(self, *args, **kwargs)
+    monkeypatch.setattr(ColdStorage, "_rebuild_bloom", counting)
+    return rebuilds
+
+
+def _wait_for_rebuild(cold: ColdStorage):
+    deadline = time.monotonic() + 10
+    while cold._bloom_pending is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cold._bloom_pending is None
+
+
+def test_saved_filter_is_reused_when_nothing_was_written_since(tmp_path, monkeypatch):
+    cold = ColdStorage(str(tmp_path))
+    for i in range(100):
+        cold.put(f"k{i}", ValueData(data="v"))
+    cold.close()
+
+    rebuilds = _count_rebuilds(monkeypatch)
+    reopened = ColdStorage(str(tmp_path))
+    assert rebuilds == []
+    assert all(reopened.might_contain(f"k{i}") for i in range(100))
+    reopened.close()
+
+
+def test_stale_or_missing_filter_is_rebuilt(tmp_path, monkeypatch):
+    cold = ColdStorage(str(tmp_path))
+    cold.put("a", ValueData(data="1"))
+    cold.close()
+    crashed = ColdStorage(str(tmp_path))
+    crashed.put("b", ValueData(data="2")) # Not in the saved filter, which is not saved again
+
+    rebuilds = _count_rebuilds(monkeypatch)
+    recovered = ColdStorage(str(tmp_path))
+    assert len(rebuilds) == 1
+    assert recovered.might_contain("a") and recovered.might_contain("b")
+    recovered.close()
+
+    os.remove(os.path.join(tmp_path, BLOOM_FILENAME))
+    reopened = ColdStorage(str(tmp_path))
+    assert len(rebuilds) == 2
+    assert reopened.might_contain("a") and reopened.might_contain("b")
+    reopened.close()
+
+
+def test_filter_grows_past_its_capacity(tmp_path):
+    cold = ColdStorage(str(tmp_path), bloom_capacity=10)
+    assert cold.bloom_stats()["capacity"] == 10
+    for i in range(50):
+        cold.put(f"k{i}", ValueData(data="v"))
+        _wait_for_rebuild(cold)
+    stats = cold.bloom_stats()
+    assert stats["capacity"] >= stats["keys"] == 50
+    assert all(cold.might_contain(f"k{i}") for i in range(50))
+    cold.close()
+
+
+def test_bloom_stats_counters(tmp_path):
+    # A filter this loose lets some absent keys through, each one a false positive
+    cold = ColdStorage(str(tmp_path), bloom_capacity=4, bloom_false_positive_rate=0.5)
+    for key in "abc":
+        cold.put(key, ValueData(data="v"))
+    assert all(cold.might_contain(key) for key in "abc")
+    absent = [cold.might_contain(f"absent{i}") for i in range(50)]
+    assert cold.bloom_stats() == {
+        "checks": 53,
+        "negatives": absent.count(False),
+        "false_positives": absent.count(True),
+        "keys": 3,
+        "capacity": 4,
+    }
+    assert 0 < absent.count(False) < 50
+    cold.close()
+
+
+def test_quorum_read_skips_replicas_the_filter_rules_out(tmp_path):
+    rm = ReplicationManager(0, 1, str(tmp_path), read_quorum="all")
+    rm.put_data("k", ValueData(data="v"))
+    rm.hot_storage.remove("k")
+    submitted = []
+    submit = rm._read_executor.submit
+    rm._read_executor.submit = lambda fn, index, *args: submitted.append(index) or submit(fn, index, *args)
+
+    assert rm.get_data("missing") is None
+    assert submitted == [] # Every replica answered from its filter, no thread hop
+    assert rm.get_data("k").data == "v"
+    assert sorted(submitted) == [0, 1]
+    assert [stats["negatives"] for stats in rm.bloom_stats()] == [1, 1]
+    rm.close()
@@ -0,0 +1,53 @@
+import pytest
+from ..metrics.histogram import LatencyHistogram, _bucket, _bucket_upper_bound
+
+
+def test_buckets_bound_values_within_an_eighth():
+    previous = -1
+    for ns in list(range(0, 5000)) + [10**6, 123_456_789, 10**12]:
+        index = _bucket(ns)
+        assert index >= previous # Buckets follow the values they hold
+        previous = index
+        assert ns <= _bucket_upper_bound(index) <= ns * 1.125
+    assert [_bucket_upper_bound(_bucket(ns)) for ns in range(16)] == list(range(16)) # Exact below 16ns
+
+
+def test_percentiles():
+    histogram = LatencyHistogram()
+    for ms in range(1, 101):
+        histogram.record(ms / 1000)
+    assert histogram.percentile(50) == pytest.approx(0.050, rel=0.125)
+    assert histogram.percentile(50) >= 0.050
+    assert histogram.percentile(99) == pytest.approx(0.099, rel=0.125)
+    assert histogram.percentile(100) == 0.1 # Capped at the largest value seen
+    summary = histogram.summary()
+    assert summary["count"] == 100
+    assert summary["mean"] == pytest.approx(0.0505)
+    assert summary["max"] == 0.1
+    assert summary["p50"] <= summary["p90"] <= summary["p99"] <= summary["p999"] <= summary["max"]
+
+
+def test_empty_histogram_reports_zero():
+    assert LatencyHistogram().summary() == {
+        "count": 0, "mean": 0.0, "p50": 0.0, "p90": 0.0, "p99": 0.0, "p999": 0.0, "max": 0.0,
+    }
+
+
+def test_negative_durations_count_as_zero():
+    histogram = LatencyHistogram()
+    histogram.record(-1.0)
+    assert histogram.summary()["max"] == 0.0
+    assert histogram.percentile(50) == 0.0
+
+
+def test_merge():
+    fast, slow = LatencyHistogram(), LatencyHistogram()
+    for _ in range(90):
+        fast.record(0.001)
+    for _ in range(10):
+        slow.record(1.0)
+    fast.merge(slow)
+    assert fast.count == 100
+    assert fast.max_ns == 10**9
+    assert fast.percentile(50) == pytest.approx(0.001, rel=0.125)
+    assert fast.percentile(95) == pytest.approx(1.0, rel=0.125)
@@ -0,0 +1,82 @@
+import pytest
+from ..storage_engine.hot_storage import HotStorage, ENTRY_OVERHEAD_BYTES
+from ..storage_engine.encoding_pb2 import ValueData #type:ignore
+
+
+def _value(data: str = "v") -> ValueData:
+    return ValueData(data=data)
+
+
+def test_entry_budget():
+    hot = HotStorage(max_entries=3, max_bytes=None)
+    for i in range(5):
+        hot.put(f"k{i}", _value())
+    assert sorted(hot.get_all_keys()) == ["k2", "k3", "k4"]
+    assert hot.stats()["evictions"] == 2
+
+
+def test_byte_budget():
+    entry_size = len("k0") + _value("x" * 100).ByteSize() + ENTRY_OVERHEAD_BYTES
+    hot = HotStorage(max_entries=None, max_bytes=3 * entry_size)
+    for i in range(5):
+        hot.put(f"k{i}", _value("x" * 100))
+    assert sorted(hot.get_all_keys()) == ["k2", "k3", "k4"]
+    assert hot.stats()["bytes"] == 3 * entry_size
+    # Rewriting a key replaces its size instead of adding to it
+    hot.put("k4", _value("x" * 100))
+    assert hot.stats()["bytes"] == 3 * entry_size
+
+
+def test_lru_evicts_least_recently_used():
+    hot = HotStorage(max_entries=3, policy="lru")
+    for key in "abc":
+        hot.put(key, _value())
+    hot.get("a")
+    hot.put("d", _value())
+    assert sorted(hot.get_all_keys()) == ["a", "c", "d"]
+
+
+@pytest.mark.parametrize("policy, survives", [("lru", False), ("arc", True)])
+def test_arc_keeps_frequent_keys_through_a_scan(policy, survives):
+    hot = HotStorage(max_entries=10, policy=policy)
+    frequent = [f"f{i}" for i in range(5)]
+    for key in frequent:
+        hot.put(key, _value())
+        hot.get(key)
+    for i in range(100): # One-off scan, every key seen once
+        hot.put(f"s{i}", _value())
+    assert all(key in hot.store for key in frequent) == survives
+
+
+def test_hit_miss_and_eviction_counters():
+    hot = HotStorage(max_entries=2)
+    hot.put_many({"a": _value(), "b": _value()})
+    assert hot.get("a") is not None
+    assert hot.get("missing") is None
+    assert hot.get_many(["a", "b", "c"])["c"] is None
+    hot.put("c", _value())
+    assert {name: hot.stats()[name] for name in ("hits", "misses", "evictions", "entries")} == {
+        "hits": 3, "misses": 2, "evictions": 1, "entries": 2,
+    }
+
+
+def test_only_dirty_victims_are_demoted():
+    demoted = []
+    hot = HotStorage(max_entries=2, on_evict=lambda key, value, timestamp: demoted.append((key, value.data, timestamp)))
+    hot.put("clean", _value("c"))
+    hot.put("dirty", _value("d"), dirty=True, timestamp=7)
+    hot.put("x", _value()) # Evicts "clean": already in cold storage
+    assert demoted == []
+    hot.put("y", _value()) # Evicts "dirty"
+    assert demoted == [("dirty", "d", 7)]
+    assert hot.stats()["dirty"] == 0
+
+
+def test_flushed_entry_is_evicted_without_demotion():
+    demoted = []
+    hot = HotStorage(max_entries=1, on_evict=lambda *args: demoted.append(args))
+    hot.put("a", _value(), dirty=True, timestamp=1)
+    hot.mark_clean({"a": 1})
+    hot.put("b", _value())
+    assert demoted == []
+    assert hot.get_all_keys() == ["b"]
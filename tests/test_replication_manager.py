@@ -0,0 +1,193 @@
+import threading
+import time
+import pytest
+from ..replication.replication_manager import ReplicationManager, QuorumNotReachedError
+from ..storage_engine.encoding_pb2 import ValueData #type:ignore
+
+
+def _fail(writes):
+    raise OSError("replica down")
+
+
+def _drain(rm: ReplicationManager):
+    # Waits for the writes already queued on every replica
+    for executor in rm._replica_executors:
+        executor.submit(lambda: None).result()
+
+
+def test_write_fails_without_quorum(tmp_path):
+    rm = ReplicationManager(0, 1, str(tmp_path), write_quorum="all")
+    rm.replicas[1].apply_many = _fail
+    with pytest.raises(QuorumNotReachedError):
+        rm.put_data("x", ValueData(data="y"))
+    assert rm.get_data("x").data == "y" # Replica 0 applied it, it's just not acknowledged by all
+    assert rm.replication_stats()["quorum_failures"] == 1
+    rm.close()
+
+
+def test_backlog_replayed_to_recovered_replica(tmp_path):
+    rm = ReplicationManager(0, 1, str(tmp_path), write_quorum=1)
+    rm.put_data("a", ValueData(data="1"))
+    lagging = rm.replicas[1]
+    apply_many = lagging.apply_many
+    lagging.apply_many = _fail
+    rm.put_data("b", ValueData(data="2"))
+    rm.delete_data("a")
+    _drain(rm)
+    assert rm.replication_stats()["backlog"] == [0, 2]
+    assert lagging.get("b") is None
+
+    lagging.apply_many = apply_many
+    assert rm.replay_backlogs() == 0
+    assert lagging.get("b").data == "2"
+    assert lagging.get("a") is None
+    rm.close()
+
+
+def test_delete_under_w1_is_not_resurrected(tmp_path):
+    rm = ReplicationManager(0, 1, str(tmp_path), write_quorum=1)
+    rm.put_data("k", ValueData(data="v1"))
+    _drain(rm)
+    gate = threading.Event()
+    rm._replica_executors[1].submit(gate.wait) # Replica 1 lags behind the delete
+    try:
+        rm.delete_data("k")
+        assert rm.get_data("k") is None
+    finally:
+        gate.set()
+    _drain(rm)
+    assert rm.get_data("k") is None
+    assert [replica.get("k") for replica in rm.replicas] == [None, None]
+    rm.close()
+
+    reopened = ReplicationManager(0, 1, str(tmp_path))
+    assert reopened.get_data("k") is None
+    reopened.close()
+
+
+def test_wal_replay_after_crash(tmp_path):
+    # Never flushes on its own, so the puts only reach cold storage through the WAL
+    crashed = ReplicationManager(0, 1, str(tmp_path), write_back=True, flush_interval=3600)
+    crashed.put_data("a", ValueData(data="1"))
+    crashed.put_data("b", ValueData(data="2"))
+    crashed.put_data("a", ValueData(data="3"))
+    crashed.delete_data("b")
+    assert crashed.replicas[0].get("a") is None
+
+    # Crash: the process goes away without flushing or closing
+    recovered = ReplicationManager(0, 1, str(tmp_path), write_back=True)
+    assert recovered.get_data("a").data == "3"
+    assert recovered.get_data("b") is None
+    recovered.flush_hot_to_cold()
+    assert [replica.get("a").data for replica in recovered.replicas] == ["3", "3"]
+    recovered.close()
+
+
+@pytest.mark.parametrize("write_back", [False, True])
+def test_promotion_does_not_replace_racing_write(tmp_path, write_back):
+    rm = ReplicationManager(0, 1, str(tmp_path), write_back=write_back)
+    rm.put_data("k", ValueData(data="v0"))
+    rm.move_to_cold("k")
+    read_cold = rm._read_cold
+
+    def read_cold_then_write(keys):
+        found = read_cold(keys) # Still v0
+        rm.put_data("k", ValueData(data="v1"))
+        return found
+
+    rm._read_cold = read_cold_then_write
+    assert rm.get_data("k").data == "v0"
+    rm._read_cold = read_cold
+    assert rm.get_data("k").data == "v1"
+    rm.flush_hot_to_cold()
+    rm.close()
+    reopened = ReplicationManager(0, 1, str(tmp_path), write_back=write_back)
+    assert reopened.get_data("k").data == "v1"
+    reopened.close()
+
+
+def test_promotion_does_not_revive_racing_delete(tmp_path):
+    rm = ReplicationManager(0, 1, str(tmp_path))
+    rm.put_data("k", ValueData(data="v0"))
+    rm.hot_storage.remove("k")
+    read_cold = rm._read_cold
+
+    def read_cold_then_delete(keys):
+        found = read_cold(keys)
+        rm.delete_data("k")
+        return found
+
+    rm._read_cold = read_cold_then_delete
+    rm.get_data("k")
+    rm._read_cold = read_cold
+    assert rm.get_data("k") is None
+    rm.close()
+
+
+def test_put_survives_clock_going_back(tmp_path, monkeypatch):
+    rm = ReplicationManager(0, 1, str(tmp_path))
+    rm.put_data("k", ValueData(data="old"))
+    rm.close()
+
+    # Restarted with the wall clock an hour behind the timestamp of the stored write
+    now = time.time_ns()
+    monkeypatch.setattr(time, "time_ns", lambda: now - 3600 * 10**9)
+    restarted = ReplicationManager(0, 1, str(tmp_path))
+    restarted.put_data("k", ValueData(data="new"))
+    restarted.close()
+    monkeypatch.undo()
+
+    reopened = ReplicationManager(0, 1, str(tmp_path))
+    assert reopened.get_data("k").data == "new"
+    assert [replica.get("k").data for replica in reopened.replicas] == ["new", "new"]
+    reopened.close()
+
+
+@pytest.mark.parametrize("write_back", [False, True])
+def test_concurrent_puts_reach_hot_in_timestamp_order(tmp_path, write_back):
+    rm = ReplicationManager(0, 1, str(tmp_path), write_back=write_back, flush_interval=3600)
+    put_many = rm.hot_storage.put_many
+    first_in, second_done = threading.Event(), threading.Event()
+
+    def slow_first_put(items, *args, **kwargs):
+        # The older put stalls right before updating hot storage until the newer one is done,
+        # or for a moment if the newer one waits its turn
+        if items["k"].data == "older":
+            first_in.set()
+            second_done.wait(0.2)
+        put_many(items, *args, **kwargs)
+
+    rm.hot_storage.put_many = slow_first_put
+    older = threading.Thread(target=rm.put_data, args=("k", ValueData(data="older")))
+    older.start()
+    first_in.wait()
+    rm.put_data("k", ValueData(data="newer"))
+    second_done.set()
+    older.join()
+
+    assert rm.get_data("k").data == "newer"
+    rm.flush_hot_to_cold()
+    _drain(rm)
+    assert [replica.get("k").data for replica in rm.replicas] == ["newer", "newer"]
+    rm.close()
+
+
+def test_failed_demotion_keeps_write_back_put(tmp_path):
+    rm = ReplicationManager(0, 1, str(tmp_path), hot_max_entries=2, write_quorum="all", write_back=True, flush_interval=3600)
+    lagging = rm.replicas[1]
+    apply_many = lagging.apply_many
+    lagging.apply_many = _fail
+    for key in "abc":
+        rm.put_data(key, ValueData(data=key)) # "c" can't demote "a" without replica 1
+    # Every put is served and logged: the victim stays dirty in hot storage, over budget
+    assert {key: rm.get_data(key).data for key in "abc"} == {"a": "a", "b": "b", "c": "c"}
+    rm.wal.rotate() # Replay only reads sealed generations
+    assert sorted(key for key, _, _ in rm.wal.replay()) == ["a", "b", "c"]
+    assert rm.hot_stats()["dirty"] == 3
+
+    lagging.apply_many = apply_many
+    rm.flush_hot_to_cold()
+    rm.put_data("d", ValueData(data="d")) # Clean victims can go now
+    assert rm.hot_stats()["entries"] == 2
+    assert [lagging.get(key).data for key in "abc"] == ["a", "b", "c"]
+    rm.close()
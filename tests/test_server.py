@@ -0,0 +1,45 @@
+import asyncio
+import random
+import time
+from ..api import KeyValueStore
+from ..network.client import AsyncKeyValueClient
+from ..network.server import KeyValueServer
+
+
+def test_close_with_idle_client_connected(tmp_path):
+    async def main():
+        store = KeyValueStore(num_shards=1, cold_dir=str(tmp_path))
+        server = KeyValueServer(store, port=0)
+        await server.start()
+        serving = asyncio.create_task(server.serve_forever())
+        _, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        await asyncio.sleep(0.05)
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+        await asyncio.wait_for(server.close(), 5)
+        store.shutdown()
+        writer.close()
+
+    asyncio.run(main())
+
+
+def test_pipelined_writes_to_one_key_keep_their_order(tmp_path):
+    async def main():
+        store = KeyValueStore(num_shards=1, cold_dir=str(tmp_path))
+        put = store.put
+
+        def slow_put(key: str, value: str):
+            time.sleep(random.random() * 0.005) # Lets later writes overtake on the offload pool
+            put(key, value)
+
+        store.put = slow_put
+        server = KeyValueServer(store, port=0, offload_workers=8)
+        await server.start()
+        async with AsyncKeyValueClient(port=server.port, pool_size=1) as client:
+            await asyncio.gather(*(client.put("k", str(i)) for i in range(30)), client.put("other", "x"))
+            assert await client.get("k") == "29"
+            assert await client.get("other") == "x"
+        await server.close()
+        store.shutdown()
+
+    asyncio.run(main())
@@ -0,0 +1,30 @@
+import os
+import signal
+import threading
+from ..api import KeyValueStore
+
+
+def test_killed_worker_is_restarted_with_its_shards(tmp_path):
+    store = KeyValueStore(num_shards=2, cold_dir=str(tmp_path), workers=2, health_interval=0.1)
+    store.put_many({f"k{i}": str(i) for i in range(100)})
+    os.kill(store.worker_stats()["workers"][0]["pid"], signal.SIGKILL)
+    store._worker_pool._workers[0].process.join()
+
+    assert store.get_many([f"k{i}" for i in range(100)]).values == {f"k{i}": str(i) for i in range(100)}
+    assert store.worker_stats()["restarts"] == 1
+    store.shutdown()
+
+
+def test_saturated_worker_is_not_restarted(tmp_path):
+    # One request thread and a backlog far longer than health_timeout: the ping is late,
+    # but every request ahead of it is answered
+    store = KeyValueStore(num_shards=1, cold_dir=str(tmp_path), workers=1, worker_threads=1,
+                          health_interval=0.05, health_timeout=0.2)
+    batch = {f"k{i}": "x" * 100 for i in range(200)}
+    writers = [threading.Thread(target=lambda: [store.put_many(batch) for _ in range(5)]) for _ in range(64)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    assert store.worker_stats()["restarts"] == 0
+    store.shutdown()
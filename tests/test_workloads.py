@@ -0,0 +1,71 @@
+import json
+from collections import Counter
+import pytest
+from ..benchmarks.bench import main
+from ..benchmarks.workloads import ZipfianGenerator, key_name, load_trace, synthetic_operations
+
+
+@pytest.mark.parametrize("theta", [0.0, 1.0, 1.5, -0.5])
+def test_zipfian_rejects_theta_outside_0_1(theta):
+    with pytest.raises(ValueError):
+        ZipfianGenerator(100, theta)
+
+
+def test_bench_rejects_theta_outside_0_1():
+    with pytest.raises(SystemExit):
+        main(["--theta", "1.0"])
+
+
+def test_zipfian_is_skewed_towards_low_items():
+    zipf = ZipfianGenerator(1000, 0.99)
+    draws = Counter(zipf.next() for _ in range(20_000))
+    assert all(0 <= item < 1000 for item in draws)
+    assert draws[0] > draws[1] > draws[10] # Item i has weight 1 / (i + 1) ** theta
+    assert draws[0] > 10 * 20_000 / 1000
+
+
+def test_synthetic_operations_follow_the_mix():
+    operations = synthetic_operations("ycsb-b", 2000, 100, value_size=8, seed=1)
+    assert operations == synthetic_operations("ycsb-b", 2000, 100, value_size=8, seed=1)
+    assert operations != synthetic_operations("ycsb-b", 2000, 100, value_size=8, seed=2)
+    counts = Counter(operation for operation, _, _ in operations)
+    assert set(counts) == {"get", "put"}
+    assert 0.9 < counts["get"] / 2000 < 0.99
+    keys = {key_name(i) for i in range(100)}
+    for operation, key, value in operations:
+        assert key in keys
+        assert value == ("x" * 8 if operation == "put" else None)
+
+    assert {operation for operation, _, _ in synthetic_operations("ycsb-c", 100, 10)} == {"get"}
+    assert {operation for operation, _, _ in synthetic_operations("write-only", 100, 10)} == {"put"}
+    with pytest.raises(ValueError):
+        synthetic_operations("ycsb-z", 10, 10)
+
+
+def test_load_trace(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    lines = [
+        {"op": "PUT", "key": "a", "value": 1},
+        {"op": "get", "key": "a"},
+        {"op": "delete", "key": 7},
+        {"request_id": "req-1", "title": "any other log line"},
+        {"id": 42},
+        ["not", "a", "dict"],
+    ]
+    path.write_text("\n".join(json.dumps(line) for line in lines[:3]) + "\n\n"
+                    + "\n".join(json.dumps(line) for line in lines[3:]) + "\n")
+    assert list(load_trace(str(path))) == [
+        ("put", "a", "1"),
+        ("get", "a", None),
+        ("delete", "7", None),
+        ("put", "req-1", json.dumps(lines[3])),
+        ("put", "42", json.dumps(lines[4])),
+        ("put", "7", json.dumps(lines[5])), # Keyed by its line number, the blank line counts
+    ]
+
+
+def test_load_trace_rejects_unknown_op(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    path.write_text(json.dumps({"op": "get", "key": "a"}) + "\n" + json.dumps({"op": "scan", "key": "a"}) + "\n")
+    with pytest.raises(ValueError, match=":2: unknown op"):
+        list(load_trace(str(path)))
@@ -0,0 +1,306 @@
+import itertools
+import json
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List
+from ..network.protocol import (
+    OP_GET, OP_PUT, OP_DELETE, OP_MGET, OP_MSET, OP_MDELETE, OP_PING,
+    STATUS_OK, ENTRY_OK, encode_frame, encode_entries, decode_entries,
+)
+from ..storage_engine.encoding_pb2 import ValueData #type:ignore
+from .worker import (
+    SHARD_PREFIX, OP_OPEN_SHARD, OP_CLOSE_SHARD, OP_KEYS, OP_FLUSH, OP_STATS, OP_MOVE_TO_COLD, OP_SHUTDOWN,
+    OP_RESET_METRICS,
+    FrameSender, run_worker, split_frames,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ShardWorkerError(Exception):
+    # An operation failed inside the worker; the message names the original exception
+    pass
+
+
+class WorkerUnavailableError(ConnectionError):
+    # The worker died (or was restarted) before answering
+    pass
+
+
+class WorkerTimeoutError(WorkerUnavailableError):
+    # The worker did not answer in time; the health check restarts it if it stays stuck
+    pass
+
+
+class ShardWorker:
+    # One worker process and the pipe to it. Requests are pipelined: callers queue their
+    # frame on a FrameSender (concurrent requests go out as one message) and wait on a
+    # future, a reader thread resolves futures as responses arrive.
+    def __init__(self, worker_id: int, context: multiprocessing.context.BaseContext, threads: int):
+        self.worker_id = worker_id
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(target=run_worker, args=(child_conn, worker_id, threads),
+                                       name=f"kv-worker-{worker_id}", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self._pending: Dict[int, Future] = {}
+        self._request_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._sender = FrameSender(self._conn.send_bytes)
+        self._dead = False
+        self.last_response = time.monotonic() # When the worker last answered any request
+        self._reader = threading.Thread(target=self._read_responses, name=f"kv-worker-{worker_id}-reader", daemon=True)
+        self._reader.start()
+
+    @property
+    def alive(self) -> bool:
+        return not self._dead and self.process.is_alive()
+
+    def request(self, opcode: int, shard_id: int, body: bytes = b"", timeout: float | None = None) -> bytes:
+        future: Future = Future()
+        with self._lock:
+            if self._dead:
+                raise WorkerUnavailableError(f"Worker {self.worker_id} is not running")
+            request_id = next(self._request_ids) & 0xFFFFFFFF
+            self._pending[request_id] = future
+        try:
+            self._sender.send(encode_frame(opcode, request_id, SHARD_PREFIX.pack(shard_id) + body))
+            status, payload = future.result(timeout)
+        except FutureTimeoutError as e:
+            raise WorkerTimeoutError(f"Worker {self.worker_id} did not answer within {timeout}s") from e
+        except (OSError, EOFError) as e:
+            raise WorkerUnavailableError(f"Worker {self.worker_id} is not reachable: {e}") from e
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+        if status != STATUS_OK:
+            raise ShardWorkerError(payload.decode("utf-8", errors="replace"))
+        return payload
+
+    def _read_responses(self):
+        try:
+            while True:
+                message = self._conn.recv_bytes()
+                responses = list(split_frames(message))
+                self.last_response = time.monotonic()
+                with self._lock:
+                    futures = [(self._pending.get(request_id), status, payload) for status, request_id, payload in responses]
+                for future, status, payload in futures:
+                    if future is not None and not future.done():
+                        future.set_result((status, payload))
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self._dead = True
+                pending = list(self._pending.values())
+            for future in pending:
+                if not future.done():
+                    future.set_exception(WorkerUnavailableError(f"Worker {self.worker_id} exited"))
+
+    def stop(self, timeout: float = 30.0):
+        # Asks the worker to flush and close its shards, killing it if it does not exit in time
+        try:
+            self.request(OP_SHUTDOWN, 0, timeout=timeout)
+        except (ConnectionError, ShardWorkerError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.kill()
+        self._conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self._conn.close()
+
+
+class WorkerPool:
+    # Worker processes hosting the shards of one KeyValueStore. Each shard lives in exactly
+    # one worker (the one with the fewest shards when it was opened) and keeps its own hot
+    # storage, cold replicas and WAL there. A supervisor thread pings every worker each
+    # health_interval seconds; the ping runs on the worker's request threads, so a worker
+    # that died, or whose threads are all stuck for health_timeout, is killed and restarted
+    # with its shards reopened, which recovers them from cold storage (and, in write-back
+    # mode, their WAL). Requests that were in flight on the failed worker raise
+    # WorkerUnavailableError; later requests go to the new worker. A late ping alone does not
+    # count as stuck while the worker keeps answering other requests. A request that gets no
+    # answer within request_timeout raises WorkerTimeoutError. Every request is a pipe round
+    # trip to another process, so workers only pay off when they get cores of their own;
+    # compare benchmarks/bench.py with and without --workers on the target machine.
+    def __init__(self, num_workers: int, start_method: str = "spawn", threads_per_worker: int = 4,
+                 health_interval: float = 1.0, health_timeout: float = 5.0, request_timeout: float | None = 30.0):
+        if num_workers < 1:
+            raise ValueError(f"num_workers must be at least 1, got {num_workers}")
+        self._context = multiprocessing.get_context(start_method)
+        self.threads_per_worker = threads_per_worker
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.request_timeout = request_timeout
+        self._workers: List[ShardWorker] = [
+            ShardWorker(worker_id, self._context, threads_per_worker) for worker_id in range(num_workers)
+        ]
+        self._assignments: Dict[int, int] = {} # shard id -> worker index
+        self._shard_options: Dict[int, Dict[str, Any]] = {}
+        self._restart_lock = threading.Lock()
+        self.restarts = 0
+
+        self._supervisor_stop = threading.Event()
+        self._supervisor = threading.Thread(target=self._supervise, name="kv-worker-supervisor", daemon=True)
+        self._supervisor.start()
+
+    def open_shard(self, shard_id: int, options: Dict[str, Any]) -> "RemoteShard":
+        # options are ReplicationManager keyword arguments (plus metrics_enabled), JSON-serializable
+        with self._restart_lock:
+            loads = [0] * len(self._workers)
+            for index in self._assignments.values():
+                loads[index] += 1
+            index = loads.index(min(loads))
+            self._assignments[shard_id] = index
+            self._shard_options[shard_id] = options
+        try:
+            self.request(shard_id, OP_OPEN_SHARD, json.dumps(options).encode("utf-8"))
+        except Exception:
+            with self._restart_lock:
+                self._assignments.pop(shard_id, None)
+                self._shard_options.pop(shard_id, None)
+            raise
+        return RemoteShard(self, shard_id)
+
+    def close_shard(self, shard_id: int):
+        self.request(shard_id, OP_CLOSE_SHARD)
+        with self._restart_lock:
+            self._assignments.pop(shard_id, None)
+            self._shard_options.pop(shard_id, None)
+
+    def request(self, shard_id: int, opcode: int, body: bytes = b"") -> bytes:
+        index = self._assignments[shard_id]
+        worker = self._workers[index]
+        if not worker.alive:
+            worker = self._restart(index, worker)
+        return worker.request(opcode, shard_id, body, timeout=self.request_timeout)
+
+    def _restart(self, index: int, failed: ShardWorker) -> ShardWorker:
+        with self._restart_lock:
+            if self._workers[index] is not failed:
+                return self._workers[index] # Already restarted by another caller
+            logger.warning("Worker %d (pid %s) is down, restarting it.", failed.worker_id, failed.process.pid)
+            failed.kill()
+            worker = ShardWorker(failed.worker_id, self._context, self.threads_per_worker)
+            for shard_id, assigned in self._assignments.items():
+                if assigned == index:
+                    try:
+                        worker.request(OP_OPEN_SHARD, shard_id, json.dumps(self._shard_options[shard_id]).encode("utf-8"),
+                                       timeout=self.request_timeout)
+                    except Exception:
+                        worker.kill() # The next request or health check tries again
+                        raise
+            self._workers[index] = worker
+            self.restarts += 1
+            return worker
+
+    def _supervise(self):
+        while not self._supervisor_stop.wait(self.health_interval):
+            for index, worker in enumerate(list(self._workers)):
+                if self._supervisor_stop.is_set():
+                    return
+                try:
+                    if worker.alive:
+                        worker.request(OP_PING, 0, timeout=self.health_timeout)
+                        continue
+                except ConnectionError as e:
+                    if isinstance(e, WorkerTimeoutError) and time.monotonic() - worker.last_response < self.health_timeout:
+                        continue # Saturated, not stuck: it kept answering the requests ahead of the ping
+                    logger.warning("Worker %d did not answer its health check within %ss.", worker.worker_id, self.health_timeout)
+                try:
+                    self._restart(index, worker)
+                except Exception as e:
+                    logger.error("Restarting worker %d failed, will retry: %s", worker.worker_id, e)
+
+    def worker_stats(self) -> List[Dict[str, Any]]:
+        with self._restart_lock:
+            assignments = dict(self._assignments)
+        return [
+            {
+                "worker": worker.worker_id,
+                "pid": worker.process.pid,
+                "alive": worker.alive,
+                "shards": sorted(shard_id for shard_id, index in assignments.items() if index == position),
+            }
+            for position, worker in enumerate(self._workers)
+        ]
+
+    def close(self):
+        self._supervisor_stop.set()
+        self._supervisor.join()
+        for worker in self._workers:
+            worker.stop()
+
+
+class RemoteShard:
+    # Stands in for a ReplicationManager that lives in a worker process; KeyValueStore
+    # uses it through the same methods
+    def __init__(self, pool: WorkerPool, shard_id: int):
+        self.pool = pool
+        self.shard_id = shard_id
+
+    def _request_entries(self, opcode: int, entries: List[tuple] | None = None) -> List[tuple]:
+        body = encode_entries(entries) if entries else b""
+        return decode_entries(self.pool.request(self.shard_id, opcode, body))
+
+    def put_data(self, key: str, value_data_pb2: ValueData):
+        self.pool.request(self.shard_id, OP_PUT, encode_entries([(ENTRY_OK, key, value_data_pb2.data)]))
+
+    def get_data(self, key: str) -> ValueData | None:
+        ((status, _, value),) = self._request_entries(OP_GET, [(ENTRY_OK, key, None)])
+        return ValueData(data=value) if status == ENTRY_OK else None
+
+    def delete_data(self, key: str) -> bool:
+        ((status, _, _),) = self._request_entries(OP_DELETE, [(ENTRY_OK, key, None)])
+        return status == ENTRY_OK
+
+    def put_many(self, items: Dict[str, ValueData]):
+        self.pool.request(self.shard_id, OP_MSET, encode_entries(
+            [(ENTRY_OK, key, value_data_pb2.data) for key, value_data_pb2 in items.items()]
+        ))
+
+    def get_many(self, keys: List[str]) -> Dict[str, ValueData | None]:
+        entries = self._request_entries(OP_MGET, [(ENTRY_OK, key, None) for key in keys])
+        return {key: ValueData(data=value) if status == ENTRY_OK else None for status, key, value in entries}
+
+    def delete_many(self, keys: List[str]) -> Dict[str, bool]:
+        entries = self._request_entries(OP_MDELETE, [(ENTRY_OK, key, None) for key in keys])
+        return {key: status == ENTRY_OK for status, key, _ in entries}
+
+    def get_all_keys(self) -> List[str]:
+        return [key for _, key, _ in self._request_entries(OP_KEYS)]
+
+    def move_to_cold(self, key: str):
+        self._request_entries(OP_MOVE_TO_COLD, [(ENTRY_OK, key, None)])
+
+    def flush_hot_to_cold(self):
+        self.pool.request(self.shard_id, OP_FLUSH)
+
+    def _stats(self) -> Dict[str, Any]:
+        return json.loads(self.pool.request(self.shard_id, OP_STATS))
+
+    def hot_stats(self) -> Dict[str, int]:
+        return self._stats()["hot"]
+
+    def bloom_stats(self) -> List[Dict[str, int]]:
+        return self._stats()["bloom"]
+
+    def replication_stats(self) -> Dict[str, Any]:
+        return self._stats()["replication"]
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        return self._stats()["metrics"]
+
+    def reset_metrics(self):
+        self.pool.request(self.shard_id, OP_RESET_METRICS)
+
+    def close(self):
+        self.pool.close_shard(self.shard_id)
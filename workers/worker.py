@@ -0,0 +1,207 @@
+import json
+import signal
+import struct
+import threading
+from collections import deque
+from multiprocessing.connection import Connection
+from typing import Callable, Deque, Dict, Iterator, List, Tuple
+from ..metrics.registry import MetricsRegistry
+from ..network.protocol import (
+    FRAME_HEADER, OP_GET, OP_PUT, OP_DELETE, OP_MGET, OP_MSET, OP_MDELETE, OP_PING,
+    STATUS_OK, STATUS_ERROR, ENTRY_OK, ENTRY_NOT_FOUND,
+    ProtocolError, encode_frame, encode_entries, decode_entries,
+)
+from ..replication.replication_manager import ReplicationManager
+from ..storage_engine.encoding_pb2 import ValueData #type:ignore
+
+# Messages between KeyValueStore and a worker process are network protocol frames sent
+# over a multiprocessing Pipe, one or more frames per message. Request payloads start
+# with the target shard id; data operations carry protocol entries, control operations JSON.
+SHARD_PREFIX = struct.Struct(">I")
+
+# Worker-only opcodes, next to the OP_* data opcodes of the network protocol
+OP_OPEN_SHARD = 16 # JSON ReplicationManager options
+OP_CLOSE_SHARD = 17
+OP_KEYS = 18
+OP_FLUSH = 19
+OP_STATS = 20 # Responds with JSON hot/bloom/replication stats and shard metrics
+OP_MOVE_TO_COLD = 21
+OP_SHUTDOWN = 22
+OP_RESET_METRICS = 23
+
+
+class FrameSender:
+    # Sends frames from many threads over one pipe. The first thread to find no send in
+    # progress sends every queued frame as one message, until the queue is empty; the
+    # others only queue theirs. Concurrent requests (or responses) share a pipe write
+    # and a wakeup on the other side instead of paying for one each.
+    def __init__(self, send_bytes: Callable[[bytes], None]):
+        self._send_bytes = send_bytes
+        self._queue: List[bytes] = []
+        self._sending = False
+        self._lock = threading.Lock()
+
+    def send(self, frame: bytes):
+        with self._lock:
+            self._queue.append(frame)
+            if self._sending:
+                return
+            self._sending = True
+        try:
+            while True:
+                with self._lock:
+                    frames, self._queue = self._queue, []
+                    if not frames:
+                        self._sending = False
+                        return
+                self._send_bytes(b"".join(frames))
+        except BaseException:
+            with self._lock:
+                self._queue.clear() # The pipe is broken, whoever waits is told by its reader
+                self._sending = False
+            raise
+
+
+def split_frames(message: bytes) -> Iterator[Tuple[int, int, bytes]]:
+    # (opcode or status, request id, payload) of every frame in a pipe message
+    position = 0
+    while position < len(message):
+        length, code, request_id = FRAME_HEADER.unpack_from(message, position)
+        position += FRAME_HEADER.size
+        yield code, request_id, message[position:position + length]
+        position += length
+
+
+def run_worker(conn: Connection, worker_id: int, threads: int):
+    # Entry point of a worker process. The request threads take turns reading the pipe:
+    # the reader runs the first request of a message itself and leaves the rest to the
+    # next free threads, so a request is not handed to another thread before it runs.
+    # The parent can keep several in flight; each response echoes its request id.
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Shutdown is driven by the parent
+    shards: Dict[int, ReplicationManager] = {}
+    shards_lock = threading.Lock()
+    sender = FrameSender(conn.send_bytes)
+    read_lock = threading.Lock() # Held by the reading thread, guards queued and state
+    queued: Deque[Tuple[int, int, bytes]] = deque() # Read but not started yet
+    state = {"stopping": False, "shutdown_request": None}
+
+    def respond(request_id: int, status: int, payload: bytes):
+        try:
+            sender.send(encode_frame(status, request_id, payload))
+        except (OSError, EOFError):
+            pass # Parent is gone
+
+    def next_request() -> Tuple[int, int, bytes] | None:
+        with read_lock:
+            while not queued:
+                if state["stopping"]:
+                    return None
+                try:
+                    message = conn.recv_bytes()
+                except (EOFError, OSError):
+                    state["stopping"] = True
+                    return None
+                for frame in split_frames(message):
+                    if frame[0] == OP_SHUTDOWN:
+                        state["stopping"] = True
+                        state["shutdown_request"] = frame[1]
+                        break
+                    if frame[0] == OP_PING:
+                        queued.appendleft(frame) # Health checks don't wait behind the backlog
+                    else:
+                        queued.append(frame)
+            return queued.popleft()
+
+    def serve():
+        # Pings run on the request threads like any request (ahead of the queue): a health
+        # check has to fail when every request thread is stuck
+        while (request := next_request()) is not None:
+            opcode, request_id, payload = request
+            try:
+                respond(request_id, STATUS_OK, _execute(shards, shards_lock, opcode, payload))
+            except Exception as e:
+                respond(request_id, STATUS_ERROR, f"{type(e).__name__}: {e}".encode("utf-8"))
+
+    request_threads = [
+        threading.Thread(target=serve, name=f"worker{worker_id}_{index}", daemon=True) for index in range(threads)
+    ]
+    for thread in request_threads:
+        thread.start()
+    for thread in request_threads:
+        thread.join()
+
+    for shard in shards.values():
+        shard.flush_hot_to_cold()
+        shard.close()
+    if state["shutdown_request"] is not None:
+        respond(state["shutdown_request"], STATUS_OK, b"")
+    conn.close()
+
+
+def _execute(shards: Dict[int, ReplicationManager], shards_lock: threading.Lock, opcode: int, payload: bytes) -> bytes:
+    (shard_id,) = SHARD_PREFIX.unpack_from(payload)
+    body = payload[SHARD_PREFIX.size:]
+    if opcode == OP_PING:
+        return b""
+    if opcode == OP_OPEN_SHARD:
+        options = json.loads(body)
+        metrics = MetricsRegistry(enabled=options.pop("metrics_enabled", True)).shard(shard_id)
+        with shards_lock:
+            if shard_id not in shards:
+                shards[shard_id] = ReplicationManager(shard_id=shard_id, metrics=metrics, **options)
+        return b""
+    if opcode == OP_CLOSE_SHARD:
+        with shards_lock:
+            shard = shards.pop(shard_id, None)
+        if shard is not None:
+            shard.close()
+        return b""
+
+    shard = shards.get(shard_id)
+    if shard is None:
+        raise KeyError(f"Shard {shard_id} is not open in this worker")
+    if opcode in (OP_GET, OP_PUT, OP_DELETE, OP_MGET, OP_MSET, OP_MDELETE, OP_MOVE_TO_COLD):
+        entries = decode_entries(body)
+        keys = [key for _, key, _ in entries]
+    if opcode == OP_GET:
+        (key,) = keys
+        data = shard.get_data(key)
+        return encode_entries([(ENTRY_OK, key, data.data) if data else (ENTRY_NOT_FOUND, key, None)])
+    if opcode == OP_PUT:
+        ((_, key, value),) = entries
+        shard.put_data(key, ValueData(data=value or ""))
+        return b""
+    if opcode == OP_DELETE:
+        (key,) = keys
+        return encode_entries([(ENTRY_OK if shard.delete_data(key) else ENTRY_NOT_FOUND, key, None)])
+    if opcode == OP_MGET:
+        found = shard.get_many(keys)
+        return encode_entries([
+            (ENTRY_OK, key, data.data) if data else (ENTRY_NOT_FOUND, key, None) for key, data in found.items()
+        ])
+    if opcode == OP_MSET:
+        shard.put_many({key: ValueData(data=value or "") for _, key, value in entries})
+        return b""
+    if opcode == OP_MDELETE:
+        deleted = shard.delete_many(keys)
+        return encode_entries([(ENTRY_OK if existed else ENTRY_NOT_FOUND, key, None) for key, existed in deleted.items()])
+    if opcode == OP_MOVE_TO_COLD:
+        for key in keys:
+            shard.move_to_cold(key)
+        return b""
+    if opcode == OP_KEYS:
+        return encode_entries([(ENTRY_OK, key, None) for key in shard.get_all_keys()])
+    if opcode == OP_FLUSH:
+        shard.flush_hot_to_cold()
+        return b""
+    if opcode == OP_RESET_METRICS:
+        shard.metrics.reset()
+        return b""
+    if opcode == OP_STATS:
+        return json.dumps({
+            "hot": shard.hot_stats(),
+            "bloom": shard.bloom_stats(),
+            "replication": shard.replication_stats(),
+            "metrics": shard.metrics.snapshot(),
+        }).encode("utf-8")
+    raise ProtocolError(f"Unknown opcode {opcode}")